@@ -0,0 +1,73 @@
+import json
+import os
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+# The columns author activity reads from each snapshot
+AUTHOR_COLUMNS = ["id", "user", "time_open_days", "lines_changed", "comments", "review_comments"]
+CACHE_SOURCE_KEY = b"author_activity.source"  # Parquet metadata naming the snapshots a cached table was built from
+
+
+def latest_rows(captures: pd.DataFrame) -> pd.DataFrame:
+    """
+    The last captured row of each pull request (by repo, when there is a "repo" column, and id).
+    """
+    keys = [*(["repo"] if "repo" in captures else []), "id"]
+    if "captured_at" in captures:
+        captures = captures.sort_values("captured_at", kind="stable")
+    return captures.drop_duplicates(keys, keep="last")
+
+
+def author_table(captures: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per author ("user") of a long DataFrame of snapshots: the number of distinct pull
+    requests (and repositories) they opened, in how many snapshots they had some open, the median
+    time open and total lines changed of their pull requests, and the review load those put on
+    others (comments and review comments received). Each pull request counts once, as last
+    captured. The authors are grouped as categories, so that only their codes are hashed.
+    """
+    prs = latest_rows(captures)
+    prs = prs.assign(user=prs["user"].astype("category"),
+                     lines_changed=prs["lines_changed"].astype("Int64"),
+                     review_load=prs["comments"].astype("Int64") + prs["review_comments"].astype("Int64"))
+    grouped = prs.groupby("user", observed=True)
+    table = pd.DataFrame({
+        "pull_requests": grouped.size(),
+        "repos": grouped["repo"].nunique() if "repo" in prs else 1,
+        "snapshots": (captures.assign(user=captures["user"].astype("category"))
+                      .groupby("user", observed=True)["captured_at"].nunique() if "captured_at" in captures else 1),
+        "median_time_open_days": grouped["time_open_days"].median(),
+        "total_lines_changed": grouped["lines_changed"].sum(),
+        "review_load": grouped["review_load"].sum(),
+    })
+    table.index = table.index.astype(str)
+    return table.sort_values(["pull_requests", "total_lines_changed"], ascending=False, kind="stable").reset_index()
+
+
+def source_key(paths: List[str]) -> str:
+    """
+    A key identifying the snapshot files (by path, size and modification time) a table is built from.
+    """
+    return json.dumps(sorted((os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path)) for path in paths))
+
+
+def read_author_cache(path: str, source: str) -> Optional[pd.DataFrame]:
+    """
+    The author table cached in a Parquet file, if it was built from the same snapshots (see source_key).
+    """
+    if not os.path.exists(path) or (pq.read_schema(path).metadata or {}).get(CACHE_SOURCE_KEY) != source.encode():
+        return None
+    return pd.read_parquet(path)
+
+
+def write_author_cache(table: pd.DataFrame, path: str, source: str):
+    """
+    Cache an author table as Parquet, for other reports (pd.read_parquet) and later runs over the same snapshots.
+    """
+    arrow_table = pa.Table.from_pandas(table, preserve_index=False)
+    pq.write_table(arrow_table.replace_schema_metadata({**(arrow_table.schema.metadata or {}),
+                                                        CACHE_SOURCE_KEY: source.encode()}), path)
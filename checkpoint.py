@@ -0,0 +1,86 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+DATETIME_COLUMNS = ["created_at", "updated_at", "closed_at", "merged_at"]
+
+
+class Checkpoint:
+    """
+    Append-only JSON-lines file of the pull-request rows completed so far, one line per row
+    written as soon as the row is done. A resumed run reads the file back and skips the PRs
+    it already holds instead of requesting them again. Paged fetchers also record the cursor
+    of their last completed page so that they can continue from the following page.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.rows: Dict[tuple, Dict] = {}
+        self.cursors: Dict[str, str] = {}
+        if resume and os.path.exists(path):
+            self.load()
+            print(f"Resuming from {path}: {len(self.rows)} pull requests already done")
+        self.file = open(path, "a" if resume else "w", encoding="utf-8")
+        if resume and self.file.tell() and not self.ends_with_newline():
+            self.file.write("\n")  # So that the next line does not run on from one cut short
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by an interruption; the lines a resumed run appended follow it
+                if "cursor" in entry:
+                    self.cursors[entry["repo"]] = entry["cursor"]
+                    continue
+                row = entry["row"]
+                for column in DATETIME_COLUMNS:
+                    row[column] = datetime.fromisoformat(row[column]) if row[column] else None
+                self.rows[(entry["repo"], row["number"])] = row
+
+    def ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def get(self, repo_name: str, number: int) -> Optional[Dict]:
+        """
+        The completed row of a pull request, or None if it still has to be processed.
+        """
+        return self.rows.get((repo_name, number))
+
+    def rows_for(self, repo_name: str) -> List[Dict]:
+        """
+        The completed rows of a repository, in the order they were completed.
+        """
+        return [row for (repo, _), row in self.rows.items() if repo == repo_name]
+
+    def cursor(self, repo_name: str) -> Optional[str]:
+        return self.cursors.get(repo_name)
+
+    def append(self, repo_name: str, row: Dict):
+        # Only written out: the rows of this run are not looked up again, so they need not stay in memory
+        with self.lock:
+            self.write({"repo": repo_name, "row": row})
+
+    def set_cursor(self, repo_name: str, cursor: str):
+        with self.lock:
+            self.cursors[repo_name] = cursor
+            self.write({"repo": repo_name, "cursor": cursor})
+
+    def write(self, entry: Dict):
+        # Flushed line by line, so an interruption loses at most the line being written
+        self.file.write(json.dumps(entry, default=lambda value: value.isoformat()) + "\n")
+        self.file.flush()
+
+    def remove(self):
+        """
+        Delete the checkpoint once the run has completed.
+        """
+        self.file.close()
+        os.remove(self.path)
@@ -0,0 +1,55 @@
+import json
+import os
+import threading
+from typing import Optional, Tuple
+
+
+MAX_ENTRIES = 50000  # Beyond this, entries not used by the current run are dropped on save
+
+
+class CompareCache:
+    """
+    Persistent memo of branch comparisons keyed by the base and head commit SHAs.
+    The commits behind/ahead of two commits never change, so a comparison only has to be
+    requested again once the main branch or the PR branch has moved.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.used = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(base_sha: str, head_sha: str) -> str:
+        return f"{base_sha}...{head_sha}"
+
+    def get(self, base_sha: str, head_sha: str) -> Optional[Tuple[int, int]]:
+        """
+        Return the cached (commits behind, commits ahead) of head compared with base, or None.
+        """
+        key = self.key(base_sha, head_sha)
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.used.add(key)
+            behind, ahead = self.entries[key]
+            return behind, ahead
+
+    def put(self, base_sha: str, head_sha: str, behind: int, ahead: int):
+        key = self.key(base_sha, head_sha)
+        with self.lock:
+            self.entries[key] = [behind, ahead]
+            self.used.add(key)
+
+    def save(self):
+        with self.lock:
+            if len(self.entries) > MAX_ENTRIES:
+                self.entries = {key: value for key, value in self.entries.items() if key in self.used}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
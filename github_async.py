@@ -0,0 +1,258 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+from tqdm import tqdm
+
+from checkpoint import Checkpoint
+from compare_cache import CompareCache
+from github_graphql import parse_timestamp
+from http_cache import HttpCache
+from rate_limit import RequestBudget
+
+
+GITHUB_API_URL = "https://api.github.com"
+DEFAULT_CONCURRENCY = 16  # Concurrent requests when no explicit worker count is given
+MAX_RETRIES = 5
+
+
+def json_to_row(pr: Dict, comparison: Optional[Tuple[int, int]]) -> Dict:
+    """
+    Convert a REST pull-request detail (and optional commits behind/ahead) into a pull-request row.
+    """
+    created_at = parse_timestamp(pr["created_at"])
+    merged_at = parse_timestamp(pr["merged_at"])
+    labels = [label["name"] for label in pr["labels"]]
+    head_repo = pr["head"]["repo"] or {}
+    is_forked = head_repo.get("fork")
+    time_open = datetime.now(timezone.utc) - created_at  # Time open until now
+
+    return {
+        "id": pr["id"],
+        "number": pr["number"],
+        "title": pr["title"],
+        "user": pr["user"]["login"],
+        "state": pr["state"],
+        "created_at": created_at,
+        "updated_at": parse_timestamp(pr["updated_at"]),
+        "closed_at": parse_timestamp(pr["closed_at"]),
+        "merged_at": merged_at,
+        "merge_commit_sha": pr["merge_commit_sha"],
+        "additions": pr["additions"],
+        "deletions": pr["deletions"],
+        "changed_files": pr["changed_files"],
+        "comments": pr["comments"],
+        "review_comments": pr["review_comments"],
+        "labels": labels,
+        "num_labels": len(labels),
+        "commits_behind_main": comparison[0] if comparison else None,
+        "commits_ahead_main": comparison[1] if comparison else None,
+        "lines_changed": pr["additions"] + pr["deletions"],  # Total lines changed
+        "time_open_days": time_open.days,  # Time open in days
+        "is_merged": merged_at is not None,  # Whether the PR is merged
+        "is_forked": is_forked,  # Whether the PR is from a forked repo
+        "source_repo": head_repo.get("full_name") if is_forked else None,  # Source repository name if forked
+        "is_draft": pr["draft"],  # Whether the PR is a draft
+        "is_locked": pr["locked"],  # Whether the PR is locked
+        "is_needs_qa": any(label.lower() == "needs qa" for label in labels),  # Check for needs QA label
+    }
+
+
+class AsyncGithubClient:
+    """
+    Minimal GitHub REST client sharing one pooled, keep-alive HTTP/2 connection between
+    all requests, with at most `concurrency` requests in flight, scheduled by a RequestBudget.
+    If a cache is given, GET requests are revalidated against it.
+    """
+
+    def __init__(self, token: str, proxies: Dict[str, Optional[str]], concurrency: int, budget: RequestBudget,
+                 cache: Optional[HttpCache] = None):
+        proxy = proxies.get("https") or proxies.get("http")
+        self.client = httpx.AsyncClient(
+            base_url=GITHUB_API_URL,
+            http2=True,
+            proxy=proxy,
+            timeout=30,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+            },
+        )
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.budget = budget
+        self.cache = cache
+
+    async def send(self, url: str, params: Dict) -> httpx.Response:
+        """
+        Send one GET request, answering it from the cache if GitHub reports it unchanged.
+        """
+        request = self.client.build_request("GET", url, params=params or None)
+        entry = self.cache.lookup(str(request.url)) if self.cache else None
+        if entry:
+            request.headers.update(HttpCache.conditional_headers(entry))
+
+        delay = self.budget.acquire(str(request.url))
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            async with self.semaphore:
+                response = await self.client.send(request)
+        except BaseException:
+            self.budget.release(str(request.url))
+            raise
+        self.budget.record(str(request.url), response.status_code, response.headers)
+        if response.status_code == 304 and entry:
+            return httpx.Response(200, headers=HttpCache.merge_headers(entry, response.headers),
+                                  content=entry["body"].encode("utf-8"), request=request)
+        if response.status_code == 200 and self.cache:
+            self.cache.store(str(request.url), response.headers, response.content)
+        return response
+
+    async def get(self, url: str, **params) -> httpx.Response:
+        """
+        GET a URL, waiting and retrying when GitHub applies a rate limit.
+        """
+        for attempt in range(MAX_RETRIES + 1):
+            response = await self.send(url, params)
+            if response.status_code not in (403, 429) or attempt == MAX_RETRIES:
+                return response
+            delay = self.budget.retry_delay(response.status_code, response.headers, attempt)
+            if delay is None:
+                return response  # A plain "forbidden" - not a rate limit
+            tqdm.write(f"Rate limited by GitHub, retrying in {delay}s...")
+            await asyncio.sleep(delay)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+async def process_pull_request(client: AsyncGithubClient, repo_name: str, number: int, main_branch: str,
+                               base_sha: Optional[str] = None, compare_cache: Optional[CompareCache] = None,
+                               compare: bool = True, checkpoint: Optional[Checkpoint] = None) -> Dict:
+    """
+    Fetch one pull request's detail and, for non-forked PRs, its comparison with the main branch
+    (unless compare is False). With a compare cache, the comparison is looked up by the main
+    (base_sha) and PR head SHAs first. With a checkpoint, a PR already done is not fetched again
+    and a newly completed row is recorded.
+    """
+    row = checkpoint.get(repo_name, number) if checkpoint else None
+    if row is not None:
+        return row
+
+    response = await client.get(f"/repos/{repo_name}/pulls/{number}")
+    response.raise_for_status()
+    pr = response.json()
+
+    comparison = None
+    head_repo = pr["head"]["repo"] or {}
+    head_sha = pr["head"]["sha"]
+    if compare and not head_repo.get("fork") and compare_cache:
+        comparison = compare_cache.get(base_sha, head_sha)
+    if compare and not head_repo.get("fork") and comparison is None:
+        ref = pr["head"]["ref"]
+        # Check that the named branch exists in this repo, then compare with main dev branch
+        branch = await client.get(f"/repos/{repo_name}/branches/{quote(ref)}")
+        if branch.is_success:
+            if compare_cache:
+                # Compare the exact commits the cache entry is keyed by
+                compare_response = await client.get(f"/repos/{repo_name}/compare/{base_sha}...{head_sha}")
+            else:
+                compare_response = await client.get(f"/repos/{repo_name}/compare/{quote(main_branch)}...{quote(ref)}")
+            if compare_response.is_success:
+                data = compare_response.json()
+                comparison = (data["behind_by"], data["ahead_by"])
+                if compare_cache:
+                    compare_cache.put(base_sha, head_sha, *comparison)
+            else:
+                branch = compare_response
+        if comparison is None:
+            print(f"PR#{pr['id']}: [{pr['title']}]\n\tError fetching branch [{ref}] - may have come from a forked repo:\n\t{branch.status_code} {branch.text}")
+
+    row = json_to_row(pr, comparison)
+    if checkpoint:
+        checkpoint.append(repo_name, row)
+    return row
+
+
+async def fetch_repository(client: AsyncGithubClient, repo_name: str, main_branch: str, progress: tqdm,
+                           compare_cache: Optional[CompareCache] = None, compare: bool = True,
+                           checkpoint: Optional[Checkpoint] = None) -> List[Dict]:
+    """
+    List the open pull requests of one repository and process them. The detail and compare
+    requests of each listed PR are started as soon as its listing page arrives, so listing,
+    detail and compare calls overlap instead of running one after another.
+    """
+    tasks = []
+
+    def task_done(_):
+        progress.update(1)
+
+    try:
+        base_sha = None
+        if compare and compare_cache:
+            # The comparisons are keyed by the commit main currently points at
+            response = await client.get(f"/repos/{repo_name}/branches/{quote(main_branch)}")
+            response.raise_for_status()
+            base_sha = response.json()["commit"]["sha"]
+
+        url = f"/repos/{repo_name}/pulls"
+        params = {"state": "open", "per_page": 100}
+        while url:
+            response = await client.get(url, **params)
+            response.raise_for_status()
+            page = response.json()
+            for pr in page:
+                task = asyncio.create_task(process_pull_request(client, repo_name, pr["number"], main_branch,
+                                                                base_sha, compare_cache, compare, checkpoint))
+                task.add_done_callback(task_done)
+                tasks.append(task)
+            progress.total += len(page)
+            progress.refresh()
+            # The "next" link already carries the query parameters
+            url = response.links.get("next", {}).get("url")
+            params = {}
+
+        print(f"Fetched {len(tasks)} pull requests from {repo_name}")
+        return list(await asyncio.gather(*tasks))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def fetch_repositories_async(repo_branches: Dict[str, str], token: str, proxies: Dict[str, Optional[str]],
+                                   budget: RequestBudget, concurrency: int = DEFAULT_CONCURRENCY,
+                                   cache: Optional[HttpCache] = None,
+                                   compare_cache: Optional[CompareCache] = None, compare: bool = True,
+                                   checkpoint: Optional[Checkpoint] = None) -> Dict[str, List[Dict]]:
+    """
+    Fetch the open pull requests of several repositories (mapped to their main branch)
+    concurrently, over a single pooled HTTP/2 client and request budget.
+    """
+    client = AsyncGithubClient(token, proxies, concurrency, budget, cache)
+    progress = tqdm(total=0, desc="Processing Pull Requests", unit="PR")
+    try:
+        results = await asyncio.gather(*[
+            fetch_repository(client, repo_name, main_branch, progress, compare_cache, compare, checkpoint)
+            for repo_name, main_branch in repo_branches.items()
+        ])
+        return dict(zip(repo_branches, results))
+    finally:
+        progress.close()
+        await client.close()
+
+
+async def fetch_pull_requests_async(repo_name: str, main_branch: str, token: str, proxies: Dict[str, Optional[str]],
+                                    budget: RequestBudget, concurrency: int = DEFAULT_CONCURRENCY,
+                                    cache: Optional[HttpCache] = None,
+                                    compare_cache: Optional[CompareCache] = None, compare: bool = True,
+                                    checkpoint: Optional[Checkpoint] = None) -> List[Dict]:
+    """
+    Fetch all open pull requests of one repository over a single pooled HTTP/2 client.
+    """
+    results = await fetch_repositories_async({repo_name: main_branch}, token, proxies, budget, concurrency, cache,
+                                             compare_cache, compare, checkpoint)
+    return results[repo_name]
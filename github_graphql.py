@@ -0,0 +1,298 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from github import Github
+from tqdm import tqdm
+
+from checkpoint import Checkpoint
+
+
+# The fields of a pull request that make up one row, shared by the listing and search queries.
+# The ahead/behind comparison with the main branch is only requested if $compare is true.
+PULL_REQUEST_FIELDS = """
+fragment PullRequestFields on PullRequest {
+  id
+  databaseId
+  number
+  title
+  author { login }
+  state
+  createdAt
+  updatedAt
+  closedAt
+  mergedAt
+  mergeCommit { oid }
+  potentialMergeCommit { oid }
+  additions
+  deletions
+  changedFiles
+  comments { totalCount }
+  reviewThreads(first: 100) { pageInfo { hasNextPage endCursor } nodes { comments { totalCount } } }
+  labels(first: 100) { pageInfo { hasNextPage endCursor } nodes { name } }
+  headRefName
+  headRef {
+    compare(headRef: $mainBranch) @include(if: $compare) { aheadBy behindBy }
+  }
+  headRepository { isFork nameWithOwner }
+  isDraft
+  locked
+}
+"""
+
+# One query returns every column of a pull-request row for a page of PRs, including the
+# ahead/behind comparison with the main branch, so no per-PR REST calls are needed.
+PULL_REQUESTS_QUERY = """
+query($owner: String!, $name: String!, $pageSize: Int!, $cursor: String, $mainBranch: String!, $compare: Boolean!) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(states: [OPEN], first: $pageSize, after: $cursor,
+                 orderBy: {field: CREATED_AT, direction: DESC}) {
+      totalCount
+      pageInfo { hasNextPage endCursor }
+      nodes { ...PullRequestFields }
+    }
+  }
+}
+""" + PULL_REQUEST_FIELDS
+
+# Search query for the pull requests (of any state) matching e.g. 'repo:owner/name is:pr created:A..B'
+SEARCH_PULL_REQUESTS_QUERY = """
+query($query: String!, $pageSize: Int!, $cursor: String, $mainBranch: String!, $compare: Boolean!) {
+  search(query: $query, type: ISSUE, first: $pageSize, after: $cursor) {
+    issueCount
+    pageInfo { hasNextPage endCursor }
+    nodes { ...PullRequestFields }
+  }
+}
+""" + PULL_REQUEST_FIELDS
+
+# The review threads and labels of one pull request after the first 100 the queries above return
+PULL_REQUEST_CONNECTIONS_QUERY = """
+query($id: ID!, $threadsCursor: String, $labelsCursor: String, $threads: Boolean!, $labels: Boolean!) {
+  node(id: $id) {
+    ... on PullRequest {
+      reviewThreads(first: 100, after: $threadsCursor) @include(if: $threads) {
+        pageInfo { hasNextPage endCursor }
+        nodes { comments { totalCount } }
+      }
+      labels(first: 100, after: $labelsCursor) @include(if: $labels) {
+        pageInfo { hasNextPage endCursor }
+        nodes { name }
+      }
+    }
+  }
+}
+"""
+
+SEARCH_LIMIT = 1000  # GitHub returns at most this many results for one search
+DEFAULT_PARTITION_WORKERS = 4
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """
+    Parse a GraphQL ISO-8601 timestamp (e.g. '2025-04-22T16:20:25Z') into an aware datetime.
+    """
+    if value is None:
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def complete_connections(g: Github, node: Dict) -> Dict:
+    """
+    Fetch the rest of the review threads and labels of a pull-request node that has more than
+    one page of them, adding them to the node, so that its counts match those of the REST API.
+    """
+    threads, labels = node["reviewThreads"], node["labels"]
+    while threads["pageInfo"]["hasNextPage"] or labels["pageInfo"]["hasNextPage"]:
+        variables = {"id": node["id"], "threadsCursor": threads["pageInfo"]["endCursor"],
+                     "labelsCursor": labels["pageInfo"]["endCursor"], "threads": threads["pageInfo"]["hasNextPage"],
+                     "labels": labels["pageInfo"]["hasNextPage"]}
+        _, data = g.requester.graphql_query(PULL_REQUEST_CONNECTIONS_QUERY, variables)
+        for key, connection in [("reviewThreads", threads), ("labels", labels)]:
+            if key in data["data"]["node"]:
+                connection["nodes"].extend(data["data"]["node"][key]["nodes"])
+                connection["pageInfo"] = data["data"]["node"][key]["pageInfo"]
+    return node
+
+
+def node_to_row(node: Dict, compare: bool = True) -> Dict:
+    """
+    Convert a GraphQL pull-request node into the same row layout produced by the REST fetcher.
+    If compare is False, the query did not ask for the comparison with the main branch.
+    """
+    created_at = parse_timestamp(node["createdAt"])
+    merged_at = parse_timestamp(node["mergedAt"])
+    labels = [label["name"] for label in node["labels"]["nodes"]]
+    head_repo = node["headRepository"] or {}
+    is_forked = head_repo.get("isFork")
+
+    # Ref.compare() treats the PR head as the base, so "ahead" and "behind" are swapped
+    # relative to repo.compare(MAIN_BRANCH, head). A missing headRef means the branch is gone.
+    comparison = None
+    if compare and not is_forked and node["headRef"] is not None:
+        comparison = node["headRef"]["compare"]
+    elif compare and not is_forked:
+        print(f"PR#{node['databaseId']}: [{node['title']}]\n\tError fetching branch [{node['headRefName']}] - may have come from a forked repo")
+
+    merge_commit = node["mergeCommit"] or node["potentialMergeCommit"]
+    closed_at = parse_timestamp(node["closedAt"])
+    time_open = (closed_at or datetime.now(timezone.utc)) - created_at  # Time open until closed (or now)
+
+    return {
+        "id": node["databaseId"],
+        "number": node["number"],
+        "title": node["title"],
+        "user": node["author"]["login"] if node["author"] else None,
+        "state": "open" if node["state"] == "OPEN" else "closed",  # REST reports merged PRs as closed
+        "created_at": created_at,
+        "updated_at": parse_timestamp(node["updatedAt"]),
+        "closed_at": closed_at,
+        "merged_at": merged_at,
+        "merge_commit_sha": merge_commit["oid"] if merge_commit else None,
+        "additions": node["additions"],
+        "deletions": node["deletions"],
+        "changed_files": node["changedFiles"],
+        "comments": node["comments"]["totalCount"],
+        "review_comments": sum(thread["comments"]["totalCount"] for thread in node["reviewThreads"]["nodes"]),
+        "labels": labels,
+        "num_labels": len(labels),
+        "commits_behind_main": comparison["aheadBy"] if comparison else None,
+        "commits_ahead_main": comparison["behindBy"] if comparison else None,
+        "lines_changed": node["additions"] + node["deletions"],  # Total lines changed
+        "time_open_days": time_open.days,  # Time open in days
+        "is_merged": merged_at is not None,  # Whether the PR is merged
+        "is_forked": is_forked,  # Whether the PR is from a forked repo
+        "source_repo": head_repo.get("nameWithOwner") if is_forked else None,  # Source repository name if forked
+        "is_draft": node["isDraft"],  # Whether the PR is a draft
+        "is_locked": node["locked"],  # Whether the PR is locked
+        "is_needs_qa": any(label.lower() == "needs qa" for label in labels),  # Check for needs QA label
+    }
+
+
+def fetch_pull_requests_graphql(g: Github, repo_name: str, main_branch: str, page_size: int = 100,
+                                compare: bool = True, checkpoint: Optional[Checkpoint] = None) -> Iterator[Dict]:
+    """
+    Fetch all open pull requests using the GitHub GraphQL API, one query per page of PRs,
+    and yield their rows page by page.
+    With a checkpoint, each completed page is recorded and a resumed run continues after it.
+    """
+    owner, name = repo_name.split("/", 1)
+    variables = {"owner": owner, "name": name, "pageSize": page_size, "cursor": None, "mainBranch": main_branch,
+                 "compare": compare}
+    done = 0
+    if checkpoint:
+        for row in checkpoint.rows_for(repo_name):
+            done += 1
+            yield row
+        variables["cursor"] = checkpoint.cursor(repo_name)
+
+    progress = None
+    while True:
+        _, data = g.requester.graphql_query(PULL_REQUESTS_QUERY, variables)
+        pull_requests = data["data"]["repository"]["pullRequests"]
+        if progress is None:
+            print(f"Fetched {pull_requests['totalCount']} pull requests from {repo_name}")
+            progress = tqdm(total=pull_requests["totalCount"], desc="Processing Pull Requests", unit="PR")
+            progress.update(done)
+
+        for node in pull_requests["nodes"]:
+            if checkpoint and checkpoint.get(repo_name, node["number"]):
+                continue  # Already recorded before the page's cursor was
+            row = node_to_row(complete_connections(g, node), compare)
+            if checkpoint:
+                checkpoint.append(repo_name, row)
+            progress.update(1)
+            yield row
+        if checkpoint:
+            checkpoint.set_cursor(repo_name, pull_requests["pageInfo"]["endCursor"])
+
+        if not pull_requests["pageInfo"]["hasNextPage"]:
+            break
+        variables["cursor"] = pull_requests["pageInfo"]["endCursor"]
+
+    progress.close()
+
+
+def search_query(repo_name: str, start: datetime, end: datetime) -> str:
+    """
+    Search query for the pull requests of a repository created between start and end (inclusive).
+    """
+    return f"repo:{repo_name} is:pr created:{start.isoformat()}..{end.isoformat()} sort:created-asc"
+
+
+def split_range(start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+    """
+    Split a range of creation times (to the second) into two halves that do not overlap.
+    """
+    middle = (start + (end - start) / 2).replace(microsecond=0)
+    return [(start, middle), (middle + timedelta(seconds=1), end)]
+
+
+def fetch_partition(g: Github, repo_name: str, start: datetime, end: datetime,
+                    page_size: int = 100) -> Tuple[Optional[List[Dict]], int]:
+    """
+    Fetch the rows of the pull requests created between start and end. Returns (None, count)
+    without fetching further pages if the range holds more PRs than one search can return.
+    """
+    variables = {"query": search_query(repo_name, start, end), "pageSize": page_size, "cursor": None,
+                 "mainBranch": "", "compare": False}  # Branches of closed PRs are usually deleted
+    rows = []
+    while True:
+        _, data = g.requester.graphql_query(SEARCH_PULL_REQUESTS_QUERY, variables)
+        search = data["data"]["search"]
+        if search["issueCount"] > SEARCH_LIMIT and end > start:
+            return None, search["issueCount"]
+        rows.extend(node_to_row(complete_connections(g, node), compare=False) for node in search["nodes"] if node)
+        if not search["pageInfo"]["hasNextPage"]:
+            return rows, search["issueCount"]
+        variables["cursor"] = search["pageInfo"]["endCursor"]
+
+
+def fetch_pull_request_history(get_github: Callable[[], Github], repo_name: str, since: Optional[datetime] = None,
+                               until: Optional[datetime] = None, workers: int = DEFAULT_PARTITION_WORKERS,
+                               page_size: int = 100) -> Iterator[Dict]:
+    """
+    Fetch every pull request of a repository, open, closed and merged, with the GraphQL search API,
+    and yield their rows as each range of creation dates completes.
+    A search returns at most 1000 results, so the creation dates (from since, by default the
+    creation of the repository, until now) are split into yearly ranges that are searched in
+    parallel, and a range holding more PRs is split in half until each fits in one search.
+    get_github returns the GitHub client of the calling thread.
+    """
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    until = until or now
+    since = since or get_github().get_repo(repo_name).created_at
+    ranges = []
+    start = since.replace(microsecond=0)
+    while start <= until:
+        end = min(datetime(start.year + 1, 1, 1, tzinfo=timezone.utc) - timedelta(seconds=1), until)
+        ranges.append((start, end))
+        start = end + timedelta(seconds=1)
+
+    def search(start, end):
+        return fetch_partition(get_github(), repo_name, start, end, page_size)  # In the worker's thread
+
+    seen = set()
+    with tqdm(total=0, desc="Backfilling Pull Requests", unit="PR") as progress:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {executor.submit(search, start, end): (start, end)
+                       for start, end in ranges}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start, end = pending.pop(future)
+                    partition, count = future.result()
+                    if partition is None:
+                        for half in split_range(start, end):
+                            pending[executor.submit(search, *half)] = half
+                        continue
+                    if len(partition) < count:
+                        tqdm.write(f"Only {len(partition)} of the {count} pull requests created at {start} could be fetched")
+                    progress.total += len(partition)
+                    progress.update(len(partition))
+                    for row in partition:
+                        if row["number"] not in seen:
+                            seen.add(row["number"])
+                            yield row
+
+    print(f"Fetched {len(seen)} pull requests from {repo_name}")
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+import requests
+from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass, Requester
+
+from rate_limit import BudgetAdapter, RequestBudget
+
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024  # 256 MiB
+# Headers describing the body, which a 304 response does not necessarily repeat
+CONTENT_HEADERS = ["content-type", "etag", "last-modified", "link"]
+# Headers of a 304 that must not be applied to the (already decoded) cached body
+SKIPPED_HEADERS = ["content-length", "content-encoding", "transfer-encoding"]
+
+
+class HttpCache:
+    """
+    On-disk cache of GET responses keyed by URL. Entries remember their ETag/Last-Modified so
+    they can be revalidated with a conditional request; GitHub answers an unchanged resource
+    with "304 Not Modified", which does not count against the rate limit.
+    The least recently used entries are evicted once the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.total_bytes = sum(entry.stat().st_size for entry in os.scandir(cache_dir) if entry.name.endswith(".json"))
+
+    def path(self, url: str, accept: Optional[str] = None) -> str:
+        key = hashlib.sha256(f"{accept} {url}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def lookup(self, url: str, accept: Optional[str] = None) -> Optional[Dict]:
+        """
+        Return the cached entry for a URL (marking it as recently used), or None.
+        """
+        path = self.path(url, accept)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)  # The modification time orders entries for LRU eviction
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def conditional_headers(entry: Dict) -> Dict[str, str]:
+        """
+        Headers that make a request conditional on the cached entry still being current.
+        """
+        headers = {}
+        if entry["headers"].get("etag"):
+            headers["If-None-Match"] = entry["headers"]["etag"]
+        if entry["headers"].get("last-modified"):
+            headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+        return headers
+
+    @staticmethod
+    def merge_headers(entry: Dict, fresh_headers) -> Dict[str, str]:
+        """
+        Combine the cached body's headers with the headers of a 304 revalidation (rate limits etc.).
+        """
+        headers = dict(entry["headers"])
+        headers.update({k.lower(): v for k, v in fresh_headers.items() if k.lower() not in SKIPPED_HEADERS})
+        return headers
+
+    def store(self, url: str, headers, body: bytes, accept: Optional[str] = None):
+        """
+        Cache a successful response if it carries a validator to revalidate it with later.
+        """
+        headers = {k.lower(): v for k, v in headers.items()}
+        if not (headers.get("etag") or headers.get("last-modified")):
+            return
+        entry = {
+            "url": url,
+            "headers": {name: headers[name] for name in CONTENT_HEADERS if name in headers},
+            "body": body.decode("utf-8"),
+        }
+        path = self.path(url, accept)
+        data = json.dumps(entry).encode("utf-8")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+
+        with self.lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self.total_bytes += len(data) - old_size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache is 10% below its size limit.
+        """
+        entries = sorted(
+            (entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        target = self.max_bytes * 0.9
+        for entry in entries:
+            if self.total_bytes <= target:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self.total_bytes -= size
+
+
+class CachingAdapter(BudgetAdapter):
+    """
+    requests transport adapter that revalidates GET requests against an HttpCache and turns
+    a "304 Not Modified" back into the cached "200 OK" response.
+    """
+
+    def __init__(self, cache: HttpCache, budget: Optional[RequestBudget] = None, **kwargs):
+        super().__init__(budget, **kwargs)
+        self.cache = cache
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+
+        accept = request.headers.get("Accept")
+        entry = self.cache.lookup(request.url, accept)
+        if entry:
+            request.headers.update(HttpCache.conditional_headers(entry))
+
+        response = super().send(request, **kwargs)
+        if response.status_code == 304 and entry:
+            response.status_code = 200
+            response.reason = "OK"
+            response._content = entry["body"].encode("utf-8")
+            response.headers = requests.structures.CaseInsensitiveDict(HttpCache.merge_headers(entry, response.headers))
+        elif response.status_code == 200:
+            self.cache.store(request.url, response.headers, response.content, accept)
+        return response
+
+
+def install_pygithub_transport(cache: Optional[HttpCache] = None, budget: Optional[RequestBudget] = None,
+                               pool_size: int = requests.adapters.DEFAULT_POOLSIZE):
+    """
+    Route every request PyGithub makes through the request budget and, if given, the cache.
+    All PyGithub clients (e.g. one per worker thread) share a single adapter, and so a single
+    pool of keep-alive connections of up to pool_size connections per host.
+
+    PyGithub has no public hook for its transport, so this relies on the internals of the
+    version pinned in requirements.txt, and raises rather than silently losing the budget
+    and cache if they have changed.
+    """
+    # injectConnectionClasses() is meant for tests and also turns off connection reuse, which
+    # is turned back on through the name-mangled Requester.__persist
+    if not hasattr(Requester, "injectConnectionClasses") or not hasattr(Requester, "_Requester__persist"):
+        raise RuntimeError("The installed PyGithub does not have the Requester internals the request budget "
+                           "and cache are installed through; install the version pinned in requirements.txt")
+    lock = threading.Lock()
+    shared = {}
+
+    class TransportConnectionClass(HTTPSRequestsConnectionClass):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            if not isinstance(getattr(self, "session", None), requests.Session) or not hasattr(self, "retry"):
+                raise RuntimeError("The installed PyGithub connection class no longer has a requests session; "
+                                   "install the version pinned in requirements.txt")
+            with lock:
+                if "adapter" not in shared:
+                    adapter_kwargs = dict(max_retries=self.retry, pool_connections=pool_size, pool_maxsize=pool_size)
+                    if cache:
+                        shared["adapter"] = CachingAdapter(cache, budget, **adapter_kwargs)
+                    else:
+                        shared["adapter"] = BudgetAdapter(budget, **adapter_kwargs)
+            self.adapter = shared["adapter"]
+            self.session.mount("https://", self.adapter)
+
+    Requester.injectConnectionClasses(HTTPRequestsConnectionClass, TransportConnectionClass)
+    Requester._Requester__persist = True
@@ -0,0 +1,174 @@
+import base64
+import json
+import os
+import subprocess
+from itertools import islice
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from row_writer import CHUNK_ROWS
+
+
+INDEX_FILE = "pr-analysis-index.json"  # Commit-graph index kept inside the mirror
+
+
+def run_git(path: str, *args: str, env: Optional[Dict[str, str]] = None) -> str:
+    """
+    Run a git command against the repository at path and return its standard output.
+    """
+    result = subprocess.run(["git", "-C", path, *args], capture_output=True, text=True, env=env, check=True)
+    return result.stdout
+
+
+def sync_mirror(path: str, repo_name: str, token: Optional[str], main_branch: str):
+    """
+    Create (on first use) and update a bare mirror holding the main branch and the head of
+    every pull request, including those opened from forks (refs/pull/<number>/head).
+    """
+    if not os.path.exists(os.path.join(path, "HEAD")):
+        os.makedirs(path, exist_ok=True)
+        run_git(path, "init", "--bare", "--quiet")
+
+    # Pass the token through the environment so it is neither stored in the mirror's
+    # config nor visible in the process list
+    env = dict(os.environ)
+    if token:
+        credentials = base64.b64encode(f"x-access-token:{token}".encode("utf-8")).decode("ascii")
+        env.update({
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": "http.https://github.com/.extraHeader",
+            "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}",
+        })
+
+    print(f"Fetching {repo_name} into local mirror {path}...")
+    run_git(
+        path, "fetch", "--quiet", "--prune", "--no-tags", f"https://github.com/{repo_name}.git",
+        f"+refs/heads/{main_branch}:refs/heads/{main_branch}",
+        "+refs/pull/*/head:refs/pull/*/head",
+        env=env,
+    )
+
+
+class CommitGraphIndex:
+    """
+    Persistent index of the number of commits reachable from a commit (or set of commits),
+    stored alongside the mirror. These counts never change once computed, so the index
+    stays valid as main advances; main's own count is updated incrementally from the
+    previous tip. Only the counts used by the last run are saved, so the index stays the
+    size of the set of open pull requests.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.main_tip = None
+        self.ancestor_counts = {}
+        self.used = set()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.main_tip = data["main_tip"]
+            self.ancestor_counts = data["ancestor_counts"]
+
+    def ancestor_count(self, mirror: str, shas: Iterable[str]) -> int:
+        """
+        Number of commits reachable from any of the given commits (themselves included).
+        """
+        shas = sorted(shas)
+        if not shas:
+            return 0
+        key = ",".join(shas)
+        self.used.add(key)
+        if key not in self.ancestor_counts:
+            self.ancestor_counts[key] = int(run_git(mirror, "rev-list", "--count", *shas))
+        return self.ancestor_counts[key]
+
+    def main_count(self, mirror: str, main_tip: str) -> int:
+        """
+        Number of commits on main, counting only the new commits if the previous tip is an ancestor.
+        """
+        if main_tip not in self.ancestor_counts and self.main_tip in self.ancestor_counts:
+            is_ancestor = subprocess.run(["git", "-C", mirror, "merge-base", "--is-ancestor", self.main_tip, main_tip]).returncode == 0
+            if is_ancestor:
+                new_commits = int(run_git(mirror, "rev-list", "--count", main_tip, f"^{self.main_tip}"))
+                self.ancestor_counts[main_tip] = self.ancestor_counts[self.main_tip] + new_commits
+        self.main_tip = main_tip
+        return self.ancestor_count(mirror, [main_tip])
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            ancestor_counts = {key: count for key, count in self.ancestor_counts.items() if key in self.used}
+            json.dump({"main_tip": self.main_tip, "ancestor_counts": ancestor_counts}, f)
+        os.replace(tmp_path, self.path)
+
+
+def compute_ahead_behind(path: str, main_branch: str, index: CommitGraphIndex,
+                         numbers: Set[int]) -> Dict[int, Tuple[int, int]]:
+    """
+    Count the commits behind/ahead of main of the heads of the given PRs in one batch pass.
+    (The mirror also holds the heads of every closed and merged PR, which are left alone.)
+
+    A single rev-list lists every commit reachable from some PR head but not from main, with
+    its parents. A PR is ahead by the commits of that graph reachable from its head. Parents
+    outside the graph are on main, and the PR is behind by the commits of main not reachable
+    from those boundary commits, which the index answers from (mostly cached) ancestor counts.
+    """
+    main_tip = run_git(path, "rev-parse", f"refs/heads/{main_branch}").strip()
+    main_count = index.main_count(path, main_tip)
+
+    heads = {}
+    for line in run_git(path, "for-each-ref", "--format=%(objectname) %(refname)", "refs/pull/").splitlines():
+        sha, ref = line.split()
+        parts = ref.split("/")  # refs/pull/<number>/head
+        if len(parts) == 4 and parts[3] == "head" and int(parts[2]) in numbers:
+            heads[int(parts[2])] = sha
+    if not heads:
+        return {}
+
+    revisions = "\n".join([*set(heads.values()), f"^{main_tip}"]) + "\n"
+    output = subprocess.run(["git", "-C", path, "rev-list", "--parents", "--stdin"], input=revisions,
+                            capture_output=True, text=True, check=True).stdout
+    graph = {}
+    for line in output.splitlines():
+        commit, *parents = line.split()
+        graph[commit] = parents
+
+    counts = {}
+    for number, head in heads.items():
+        # Walk the PR-only commits reachable from the head, collecting the boundary on main
+        ahead, boundary = set(), set()
+        pending = [head]
+        while pending:
+            commit = pending.pop()
+            if commit not in graph:
+                boundary.add(commit)
+            elif commit not in ahead:
+                ahead.add(commit)
+                pending.extend(graph[commit])
+        counts[number] = (main_count - index.ancestor_count(path, boundary), len(ahead))
+    return counts
+
+
+def fill_ahead_behind(rows: Iterable[Dict], path: str, repo_name: str, token: Optional[str],
+                      main_branch: str) -> Iterator[Dict]:
+    """
+    Yield the rows with their commits_behind_main/commits_ahead_main set from a local mirror of
+    the repository. The mirror is synchronised before the first row is read; the rows are then
+    counted CHUNK_ROWS at a time, each chunk in one batch pass over its pull requests.
+    """
+    sync_mirror(path, repo_name, token, main_branch)
+    # Let git maintain its own commit-graph file (generation numbers) to speed up the walks
+    run_git(path, "commit-graph", "write", "--reachable", "--split")
+
+    index = CommitGraphIndex(os.path.join(path, INDEX_FILE))
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, CHUNK_ROWS))
+        if not chunk:
+            break
+        counts = compute_ahead_behind(path, main_branch, index, {row["number"] for row in chunk})
+        for row in chunk:
+            comparison = counts.get(row["number"])
+            row["commits_behind_main"] = comparison[0] if comparison else None
+            row["commits_ahead_main"] = comparison[1] if comparison else None
+            yield row
+    index.save()
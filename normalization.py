@@ -0,0 +1,185 @@
+import json
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# min-max: 0 at the minimum, 1 at the maximum
+# zscore: standard deviations from the mean
+# rank: the percentile of the value, from 0 to 1
+# log: min-max of log(1 + x), for heavy-tailed counts such as lines_changed
+# robust: min-max between the 5th and 95th percentiles, clipped to [0, 1]
+METHODS = ["minmax", "zscore", "rank", "log", "robust"]
+# The percentiles kept for each column when fitting for any method; rank interpolates between them
+PERCENTILES = np.linspace(0, 100, 101)
+ROBUST_PERCENTILES = (5, 95)
+# The percentiles each method needs, so that a single method only computes those
+METHOD_PERCENTILES = {
+    "minmax": (0, 100),
+    "zscore": (),
+    "rank": tuple(PERCENTILES),
+    "log": (0, 100),
+    "robust": ROBUST_PERCENTILES,
+}
+
+
+class NormalizationStats(NamedTuple):
+    """
+    The statistics the columns are normalized with, one value (or row of percentiles) per column.
+    Computed once with fit, they can be reused for other snapshots so that their normalized
+    values are on the same scale.
+    """
+    columns: List[str]
+    count: np.ndarray
+    mean: Optional[np.ndarray]  # Only computed for zscore
+    std: Optional[np.ndarray]
+    levels: np.ndarray  # The percentiles (0-100) computed
+    percentiles: np.ndarray  # One row per level, one column per column
+
+    def at(self, *levels: float) -> np.ndarray:
+        """
+        The rows of percentiles at the given levels.
+        """
+        positions = np.searchsorted(self.levels, levels)
+        found = (self.levels[np.minimum(positions, len(self.levels) - 1)] == levels if len(self.levels)
+                 else np.zeros(len(levels), dtype=bool))  # Fitted for zscore alone
+        if not found.all():
+            missing = ", ".join(f"{level:g}" for level, present in zip(levels, found) if not present)
+            raise ValueError(f"Percentiles {missing} were not computed; fit without a method to compute them all")
+        return self.percentiles[positions]
+
+    def select(self, columns: List[str]) -> "NormalizationStats":
+        """
+        The statistics of the given columns only.
+        """
+        positions = [self.columns.index(column) for column in columns]
+        return NormalizationStats(list(columns), self.count[positions],
+                                  None if self.mean is None else self.mean[positions],
+                                  None if self.std is None else self.std[positions],
+                                  self.levels, self.percentiles[:, positions])
+
+
+def as_matrix(df: pd.DataFrame, columns: List[str]) -> np.ndarray:
+    """
+    The columns of df as one float matrix, missing values (including pandas' NA) as NaN.
+    """
+    return df[columns].to_numpy(dtype="float64", na_value=np.nan)
+
+
+def matrix_stats(matrix: np.ndarray, columns: List[str], method: Optional[str] = None) -> NormalizationStats:
+    """
+    The statistics of each column of matrix that method needs (all of them, without a method),
+    over the values present. A column without any has a NaN mean and standard deviation and
+    percentiles of 0.
+    """
+    if method is not None and method not in METHOD_PERCENTILES:
+        raise ValueError(f"Unknown normalization method {method!r}; expected one of {', '.join(METHODS)}")
+    present = ~np.isnan(matrix)
+    count = present.sum(axis=0)
+    mean = std = None
+    if method in (None, "zscore"):
+        filled = np.where(present, matrix, 0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = filled.sum(axis=0) / count
+            std = np.sqrt(np.where(present, (matrix - mean) ** 2, 0).sum(axis=0) / count)
+
+    levels = np.asarray(PERCENTILES if method is None else METHOD_PERCENTILES[method], dtype="float64")
+    percentiles = np.zeros((len(levels), matrix.shape[1]))
+    for position in range(matrix.shape[1] if len(levels) else 0):
+        values = matrix[:, position] if count[position] == len(matrix) else matrix[present[:, position], position]
+        if not len(values):
+            continue
+        if tuple(levels) == (0, 100):
+            percentiles[:, position] = values.min(), values.max()  # No need to sort
+        else:
+            percentiles[:, position] = np.percentile(values, levels)
+    return NormalizationStats(list(columns), count, mean, std, levels, percentiles)
+
+
+def fit(df: pd.DataFrame, columns: List[str], method: Optional[str] = None) -> NormalizationStats:
+    """
+    The statistics of the given columns of df: those one method needs, or by default those
+    of every method.
+    """
+    return matrix_stats(as_matrix(df, columns), columns, method)
+
+
+def scale(matrix: np.ndarray, low: np.ndarray, high: np.ndarray) -> np.ndarray:
+    """
+    Scale each column from [low, high] to [0, 1]. A column whose low and high are equal (a
+    constant column, or a flag that is rarely set) scales to 1 above them and 0 otherwise,
+    rather than dividing by zero.
+    """
+    span = high - low
+    constant = ~(span > 0)
+    scaled = (matrix - low) / np.where(constant, 1, span)  # Missing values stay NaN
+    if constant.any():
+        values = matrix[:, constant]
+        scaled[:, constant] = np.where(np.isnan(values), np.nan, values > low[constant])
+    return scaled
+
+
+def normalize_matrix(matrix: np.ndarray, method: str, stats: NormalizationStats) -> np.ndarray:
+    """
+    Normalize the columns of matrix (the columns of stats, in order) with one of METHODS.
+    Missing values stay NaN, and do not affect the others.
+    """
+    if method == "minmax":
+        low, high = stats.at(0, 100)
+        return scale(matrix, low, high)
+    if method == "log":
+        low, high = stats.at(0, 100)
+        return scale(np.log1p(np.maximum(matrix, 0)), np.log1p(np.maximum(low, 0)), np.log1p(np.maximum(high, 0)))
+    if method == "robust":
+        low, high = stats.at(*ROBUST_PERCENTILES)
+        scaled = scale(matrix, low, high)
+        return np.clip(scaled, 0, 1, out=scaled)
+    if method == "zscore":
+        if stats.mean is None:
+            raise ValueError("The mean and standard deviation were not computed; fit without a method to compute them")
+        with np.errstate(invalid="ignore", divide="ignore"):
+            scores = np.where(stats.std > 0, (matrix - stats.mean) / stats.std, 0.0)
+        return np.where(np.isnan(matrix), np.nan, scores)
+    if method == "rank":
+        percentiles = stats.at(*PERCENTILES)  # All of them, not just those another method was fitted with
+        ranks = np.empty_like(matrix)
+        for position in range(matrix.shape[1]):
+            column = percentiles[:, position]
+            if column[0] == column[-1]:
+                ranks[:, position] = matrix[:, position] > column[0]
+            else:
+                # The first percentile at each distinct value, so that ties get the same rank
+                values, first = np.unique(column, return_index=True)
+                ranks[:, position] = np.interp(matrix[:, position], values, PERCENTILES[first] / 100)
+        return np.where(np.isnan(matrix), np.nan, ranks)
+    raise ValueError(f"Unknown normalization method {method!r}; expected one of {', '.join(METHODS)}")
+
+
+def normalize(df: pd.DataFrame, columns: Optional[List[str]] = None, method: str = "minmax",
+              stats: Optional[NormalizationStats] = None) -> pd.DataFrame:
+    """
+    The columns of df normalized with one of METHODS, all in one pass over one matrix, computing
+    only the statistics that method needs. With stats (from fit, on this or another snapshot),
+    those are used instead of the statistics of df, and columns default to theirs.
+    """
+    columns = columns or (stats.columns if stats else list(df.select_dtypes(["number", "bool", "boolean"]).columns))
+    matrix = as_matrix(df, columns)
+    stats = matrix_stats(matrix, columns, method) if stats is None else stats.select(columns)
+    return pd.DataFrame(normalize_matrix(matrix, method, stats), index=df.index, columns=columns)
+
+
+def save_stats(stats: NormalizationStats, path: str):
+    """
+    Save statistics as JSON, to normalize later snapshots on the same scale.
+    """
+    with open(path, "w") as file:
+        json.dump({field: value.tolist() if isinstance(value, np.ndarray) else value
+                   for field, value in stats._asdict().items()}, file)
+
+
+def load_stats(path: str) -> NormalizationStats:
+    with open(path) as file:
+        fields = json.load(file)
+    return NormalizationStats(fields.pop("columns"), **{field: None if value is None else np.array(value, dtype="float64")
+                                                        for field, value in fields.items()})
@@ -1,6 +1,8 @@
 import os
-from datetime import datetime, timezone
-from typing import Dict, List
+import re
+from datetime import date, datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
 import argparse  # Add argparse for command-line argument parsing
 import pandas as pd
@@ -12,37 +14,86 @@ from tabulate import tabulate
 import plotly.graph_objects as go
 from tqdm import tqdm  # Add tqdm for progress bar
 
+from author_activity import AUTHOR_COLUMNS, author_table, read_author_cache, source_key, write_author_cache
+from normalization import normalize
+from pr_scoring import DEFAULT_WEIGHTS, SCORE_COLUMNS, parse_weights, score_pull_requests, top_scored
+from report_engine import Ranking, Summary, compute_report
+from snapshot_store import list_captures, load_snapshots
+from snapshot_diff import DIFF_COLUMNS, diff_snapshots, summarize_diff
+from snapshot_trends import TREND_COLUMNS, capture_aggregates, create_trends_chart, largest_changes
+from streaming_stats import StreamingReport, iter_file_chunks, iter_store_chunks
+from sql_backend import connect, import_frame, query_averages, query_ranking
+
 
 load_dotenv()
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 REPO_NAME = os.getenv("REPO_NAME")
 MAIN_BRANCH = os.getenv("MAIN_BRANCH", "main")  # Default to "main" if not specified
 
+DATETIME_COLUMNS = ["created_at", "updated_at", "closed_at", "merged_at"]
+# Dtypes the CSV columns are read into: categories for the few distinct strings, and the
+# datetime columns kept as text until they are needed (see parse_datetimes)
+CSV_DTYPES = {
+    "repo": "category",
+    "user": "category",
+    "state": "category",
+    "source_repo": "category",
+    **{column: "string" for column in DATETIME_COLUMNS},
+}
+# Counters are narrowed to 32 bits once read (nullable if a snapshot lacks some values),
+# which is much faster than having the CSV parser produce nullable integers
+COUNTER_COLUMNS = ["number", "additions", "deletions", "changed_files", "comments", "review_comments", "num_labels",
+                   "commits_behind_main", "commits_ahead_main", "lines_changed", "time_open_days"]
+FLAG_COLUMNS = ["is_merged", "is_forked", "is_draft", "is_locked", "is_needs_qa"]
+
+# The columns the report reads, so that a snapshot store only has to load these
+REPORT_COLUMNS = ["number", "title", "time_open_days", "changed_files", "commits_behind_main", "lines_changed",
+                  "num_labels", "comments"]
 
-def fetch_pull_request_data(filename: str) -> pd.DataFrame:
+
+def fetch_pull_request_data(filename: str, columns: Optional[List[str]] = None, parse_dates: bool = False,
+                            parquet: bool = False) -> pd.DataFrame:
     """
-    Load pull request data from a JSON file.
+    Load pull request data from a CSV file, or from a Parquet file (written by pull-requests.py
+    --parquet, given with parquet or named *.parquet), whose columns are already typed. With
+    columns, only those columns are read. The CSV columns are read into compact dtypes, and its
+    datetime columns are left as text unless parse_dates is set (see parse_datetimes).
     """
-    with open(filename, "r") as f:
-        pr_list = pd.read_csv(filename)
-
-    df = pd.DataFrame(pr_list)
-    # Convert datetime columns to pandas datetime
-    df["created_at"] = pd.to_datetime(df["created_at"])
-    df["updated_at"] = pd.to_datetime(df["updated_at"])
-    df["closed_at"] = pd.to_datetime(df["closed_at"])
-    df["merged_at"] = pd.to_datetime(df["merged_at"])
+    if parquet or filename.endswith(".parquet"):
+        return pd.read_parquet(filename, columns=columns)
 
+    if columns is not None:
+        header = pd.read_csv(filename, nrows=0).columns
+        columns = [column for column in columns if column in header]
+    df = pd.read_csv(filename, usecols=columns, dtype=CSV_DTYPES)
+    for column in COUNTER_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("int32" if df[column].dtype.kind == "i" else "Int32")
+    for column in FLAG_COLUMNS:
+        if column in df and df[column].dtype.kind != "b":
+            df[column] = df[column].astype("boolean")  # Some values missing
+    if parse_dates:
+        df = parse_datetimes(df)
     return df
 
 
+def parse_datetimes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert the datetime columns a CSV snapshot was loaded with from text to UTC datetimes.
+    """
+    for column in DATETIME_COLUMNS:
+        if column in df and not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = pd.to_datetime(df[column], utc=True, format="ISO8601")
+    return df
 
-def normalize_column(column):
-    return (column - column.min()) / (column.max() - column.min())
 
-def create_radar_chart(df):
+def create_radar_chart(df, stats=None):
+    """
+    Radar chart of the average min-max normalized metrics (see normalization). With stats
+    (normalization.fit on a reference snapshot), the charts of several snapshots share one scale.
+    """
     metrics = ['num_labels', 'commits_behind_main', 'time_open_days', 'comments']
-    normalized_df = df[metrics].apply(normalize_column)
+    normalized_df = normalize(df, metrics, "minmax", stats)
     averages = normalized_df.mean()
 
     # Add the total number of pull requests as another dimension
@@ -139,6 +190,159 @@ def create_dataframe(pr_list: List[Dict]) -> pd.DataFrame:
     return pr_df
 
 
+# The report: the mean of each summary metric, then each ranking (the first k rows by its columns)
+REPORT_SUMMARIES = [
+    Summary("Average time open", "time_open_days", " days"),
+    Summary("Average number of changed files", "changed_files"),
+    Summary("Average commits behind main", "commits_behind_main"),
+    Summary("Average lines changed", "lines_changed"),
+    Summary("Average number of labels", "num_labels"),
+    Summary("Average comments", "comments"),
+]
+REPORT_RANKINGS = [
+    Ranking("Top {k} Pull-Requests with the least number of labels:",
+            ['num_labels'], ['number', 'title', 'num_labels']),
+    Ranking("\nTop {k} Pull-Requests that are the furthest behind main:",
+            ['commits_behind_main'], ['number', 'title', 'commits_behind_main'], descending=True),
+    Ranking("\nTop {k} Pull-Requests that have the most lines changed:",
+            ['lines_changed'], ['number', 'title', 'lines_changed'], descending=True),
+    Ranking("\nTop {k} oldest (most days open) Pull-Requests:",
+            ['time_open_days'], ['number', 'title', 'time_open_days'], descending=True),
+    # The pull requests with the least values for the three metrics
+    Ranking("Top {k} Pull-Requests with the least 'commits_behind_main', 'num_labels', and 'lines_changed':",
+            ['commits_behind_main', 'num_labels', 'lines_changed'],
+            ['number', 'title', 'commits_behind_main', 'num_labels', 'lines_changed'], k=20, skip_missing=False),
+]
+
+
+def print_report(total: int, averages: Dict[str, float], tables: List[pd.DataFrame], k: Optional[int] = None):
+    """
+    Print the summary statistics and the rankings of the pull requests (REPORT_SUMMARIES and
+    REPORT_RANKINGS), given the means by metric and one table per ranking. k overrides the k of
+    every ranking.
+    """
+    # Print some statistics about the pull requests
+    print(f"Total pull requests: {total}")
+    for summary in REPORT_SUMMARIES:
+        print(f"{summary.label}: {averages[summary.metric]:.2f}{summary.unit}")
+    for ranking, table in zip(REPORT_RANKINGS, tables):
+        print(ranking.title.format(k=k or ranking.k))
+        print(tabulate(table, headers="keys", tablefmt="pipe"))
+
+
+def print_scores(df: pd.DataFrame, weights: Dict[str, float], k: Optional[int] = None):
+    """
+    Print the pull requests with the highest priority scores (see pr_scoring), with the columns the score is made of.
+    """
+    table = top_scored(df, score_pull_requests(df, weights), k or 10)
+    columns = [*(["repo"] if "repo" in table else []), "number", "title", "score",
+               *[column for column in SCORE_COLUMNS if column in table and weights.get(column)]]
+    print(f"\nTop {k or 10} Pull-Requests by priority score:")
+    print(tabulate(table[columns], headers="keys", tablefmt="pipe", floatfmt=".3f"))
+
+
+def snapshot_time(filename: str) -> datetime:
+    """
+    When a snapshot file was captured: the date its name starts with (e.g. 2025-04-17-tmforum.csv),
+    or else the time it was last modified.
+    """
+    match = re.match(r"(\d{4}-\d{2}-\d{2})", os.path.basename(filename))
+    if match:
+        return datetime.fromisoformat(match.group(1)).replace(tzinfo=timezone.utc)
+    return datetime.fromtimestamp(os.path.getmtime(filename), timezone.utc).replace(microsecond=0)
+
+
+def print_sql_report(conn, repos=None, until=None, k=None):
+    """
+    The same report as print_report, run as indexed queries over the latest captures in a SQLite database.
+    The rows of the rankings are numbered by rank, as the database does not keep their row in the snapshot.
+    """
+    averages = query_averages(conn, [summary.metric for summary in REPORT_SUMMARIES], repos, until)
+    print_report(averages.pop("total"), averages, [
+        query_ranking(conn, ranking.columns, ranking.order_by, k or ranking.k, ranking.descending,
+                      ranking.skip_missing, repos=repos, until=until)
+        for ranking in REPORT_RANKINGS
+    ], k)
+
+
+def print_diff(snapshots):
+    """
+    Print what changed between each pair of consecutive (name, DataFrame) snapshots.
+    """
+    diff = diff_snapshots(snapshots)
+    print("Changes between snapshots:")
+    print(tabulate(summarize_diff(diff, [name for name, _ in snapshots]), headers="keys", tablefmt="pipe",
+                   showindex=False))
+    headings = {
+        "new": "New Pull-Requests",
+        "closed": "Closed or merged Pull-Requests",
+        "behind": "Pull-Requests that fell further behind main",
+        "labels": "Pull-Requests whose labels changed",
+        "comments": "Pull-Requests with new comments",
+    }
+    for kind, heading in headings.items():
+        if len(diff[kind]):
+            print(f"\n{heading}:")
+            print(tabulate(diff[kind], headers="keys", tablefmt="pipe", showindex=False))
+
+
+def load_snapshot_files(filenames: List[str], columns: List[str]) -> pd.DataFrame:
+    """
+    Load the given columns of several snapshot files in parallel, as one DataFrame with the
+    time each was captured (see snapshot_time) in a "captured_at" column.
+    """
+    with ThreadPoolExecutor(max_workers=min(8, len(filenames))) as executor:
+        frames = list(executor.map(lambda filename: fetch_pull_request_data(filename, columns), filenames))
+    return pd.concat([df.assign(captured_at=snapshot_time(filename)) for filename, df in zip(filenames, frames)],
+                     ignore_index=True)
+
+
+def print_trends(captures: pd.DataFrame, capture_times: Optional[pd.DataFrame] = None):
+    """
+    Print the per-capture aggregates of a long DataFrame of snapshots and the pull requests
+    that fell furthest behind main over them, and chart the aggregates over time. capture_times
+    lists the captures of a snapshot store, so that those without any rows are kept.
+    """
+    aggregates = capture_aggregates(captures, capture_times=capture_times)
+    print("Trends across snapshots:")
+    print(tabulate(aggregates, headers="keys", tablefmt="pipe", showindex=False, floatfmt=".2f"))
+    print("\nTop 10 Pull-Requests that fell the furthest behind main over these snapshots:")
+    print(tabulate(largest_changes(captures, "commits_behind_main"), headers="keys", tablefmt="pipe", showindex=False))
+
+    fig = create_trends_chart(aggregates)
+    fig.show()
+    fig.write_html("pull-request-trends.html")
+    print("Trends chart saved to pull-request-trends.html")
+
+
+def print_authors(table: pd.DataFrame, k: Optional[int] = None):
+    """
+    Print the k most active authors of an author table (see author_activity).
+    """
+    print(f"Top {k or 20} authors by pull requests opened:")
+    print(tabulate(table.head(k or 20), headers="keys", tablefmt="pipe", showindex=False, floatfmt=".1f"))
+
+
+def print_streaming_report(chunks):
+    """
+    Print the summary statistics of the report from chunks of rows, in constant memory, with
+    the count, standard deviation, range and approximate quantiles of each metric (and per
+    repository, when there are several).
+    """
+    report = StreamingReport([summary.metric for summary in REPORT_SUMMARIES])
+    for chunk in chunks:
+        report.update(chunk)
+    totals = report.total()
+    print(f"Total pull requests: {sum(report.rows.values())}")
+    for summary in REPORT_SUMMARIES:
+        print(f"{summary.label}: {totals[summary.metric].mean:.2f}{summary.unit}")
+    print("\nStatistics per metric (quantiles approximate):")
+    print(tabulate(report.table(), headers="keys", tablefmt="pipe", showindex=False, floatfmt=".2f"))
+    if len(report.rows) > 1:
+        print("\nStatistics per repository:")
+        print(tabulate(report.table(by_repo=True), headers="keys", tablefmt="pipe", showindex=False, floatfmt=".2f"))
+
+
 def main():
     """
     Read a CSV representing pull requests from a GitHub repository and visualize the complexity of the pull requests.
@@ -148,57 +352,95 @@ def main():
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description="Visualize GitHub pull requests.")
     parser.add_argument("--csv", type=str, help="Load CSV file of pull-requests.")
+    parser.add_argument("--parquet", type=str, help="Load Parquet file of pull-requests.")
+    parser.add_argument("--store", type=str, help="Load the latest capture (up to --until) from this snapshot store.")
+    parser.add_argument("--repo", type=str, action="append", help="With --store, only this repository (may be repeated).")
+    parser.add_argument("--since", type=date.fromisoformat, help="With --store, only captures taken on or after this date (YYYY-MM-DD).")
+    parser.add_argument("--until", type=date.fromisoformat, help="With --store, only captures taken on or before this date (YYYY-MM-DD).")
+    parser.add_argument("--diff", type=str, nargs="*", help="Report what changed between consecutive snapshot files (CSV or Parquet) or, with no files, between the captures of --store.")
+    parser.add_argument("--trends", type=str, nargs="*", help="Chart per-capture aggregates over several snapshot files or, with no files, the captures of --store.")
+    parser.add_argument("--top", type=int, help="Number of pull requests in each ranking of the report (default 10, and 20 for the combined one).")
+    parser.add_argument("--score", action="store_true", help="Also rank the pull requests by a weighted priority score.")
+    parser.add_argument("--weights", type=parse_weights, help="With --score, weights as column=weight,... (e.g. time_open_days=2,is_draft=0) over the defaults.")
+    parser.add_argument("--stream", action="store_true", help="Only print the summary statistics (with quantiles, per repository), reading --csv/--parquet/--store in chunks with constant memory.")
+    parser.add_argument("--authors", type=str, nargs="*", help="Report per-author activity over several snapshot files or, with no files, the captures of --store.")
+    parser.add_argument("--author-cache", type=str, help="With --authors, Parquet file caching the author table; reused while the snapshots are unchanged.")
+    parser.add_argument("--db", type=str, help="SQLite database of captures: --csv/--parquet/--store are imported into it, and the report is run as SQL queries.")
     args = parser.parse_args()
 
-    # Create a DataFrame
-    pr_df = fetch_pull_request_data(args.csv)
-    # Print some statistics about the pull requests
-    print(f"Total pull requests: {len(pr_df)}")
-    print(f"Average time open: {pr_df['time_open_days'].mean():.2f} days")
-    print(f"Average number of changed files: {pr_df['changed_files'].mean():.2f}")
-    print(f"Average commits behind main: {pr_df['commits_behind_main'].mean():.2f}")
-    print(f"Average lines changed: {pr_df['lines_changed'].mean():.2f}")
-    print(f"Average number of labels: {pr_df['num_labels'].mean():.2f}")
-    print(f"Average comments: {pr_df['comments'].mean():.2f}")
-    # PR IDs and names and num_labels of those PRs with the least number of labels
-    print("Top 10 Pull-Requests with the least number of labels:")
-    print(tabulate(
-        pr_df.nsmallest(10, 'num_labels')[['number', 'title', 'num_labels']],
-        headers="keys",
-        tablefmt="pipe"
-    ))
-    # PR IDs, names and metric that are the furthest behind main
-    print("\nTop 10 Pull-Requests that are the furthest behind main:")
-    print(tabulate(
-        pr_df.nlargest(10, 'commits_behind_main')[['number', 'title', 'commits_behind_main']],
-        headers="keys",
-        tablefmt="pipe"
-    ))
-    # Top 10 pull-requests that have the most lines changed
-    print(f"\nTop 10 Pull-Requests that have the most lines changed:")
-    print(tabulate(
-        pr_df.nlargest(10, 'lines_changed')[['number', 'title', 'lines_changed']],
-        headers="keys",
-        tablefmt="pipe"
-    ))
-    # Top 10 oldest (most days open) pull-requests
-    print(f"\nTop 10 oldest (most days open) Pull-Requests:")
-    print(tabulate(
-        pr_df.nlargest(10, 'time_open_days')[['number', 'title', 'time_open_days']],
-        headers="keys",
-        tablefmt="pipe"
-    ))
+    if args.diff is not None:
+        if args.diff:
+            print_diff([(os.path.basename(filename), fetch_pull_request_data(filename, DIFF_COLUMNS))
+                        for filename in args.diff])
+        else:
+            captures = load_snapshots(args.store, args.repo, args.since, args.until, DIFF_COLUMNS)
+            # The captures are listed from the store, so that one without any rows (all its pull requests closed) counts
+            for repo_name, listed in list_captures(args.store, args.repo, args.since, args.until).groupby("repo", sort=False):
+                repo_captures = captures[captures["repo"] == repo_name]
+                by_time = dict(list(repo_captures.groupby("captured_at")))
+                print(f"\n{repo_name}")
+                print_diff([(f"{captured_at:%Y-%m-%d %H:%M}", by_time.get(captured_at, repo_captures.iloc[:0]))
+                            for captured_at in listed["captured_at"]])
+        return
 
-    # Extract the top 10 pull requests based on the least values for the three metrics
-    top_prs = pr_df.sort_values(by=['commits_behind_main', 'num_labels', 'lines_changed']).head(20)
+    if args.trends is not None:
+        if args.trends:
+            print_trends(load_snapshot_files(args.trends, TREND_COLUMNS))
+        else:
+            print_trends(load_snapshots(args.store, args.repo, args.since, args.until, TREND_COLUMNS),
+                         list_captures(args.store, args.repo, args.since, args.until))
+        return
 
-    # Print the result as a Markdown table
-    print("Top 20 Pull-Requests with the least 'commits_behind_main', 'num_labels', and 'lines_changed':")
-    print(tabulate(
-        top_prs[['number', 'title', 'commits_behind_main', 'num_labels', 'lines_changed']],
-        headers="keys",
-        tablefmt="pipe"
-    ))
+    if args.authors is not None:
+        paths = args.authors or list(list_captures(args.store, args.repo, args.since, args.until)["path"])
+        source = source_key(paths)
+        table = read_author_cache(args.author_cache, source) if args.author_cache else None
+        if table is None:
+            if args.authors:
+                captures = load_snapshot_files(args.authors, AUTHOR_COLUMNS)
+            else:
+                captures = load_snapshots(args.store, args.repo, args.since, args.until, AUTHOR_COLUMNS)
+            table = author_table(captures)
+            if args.author_cache:
+                write_author_cache(table, args.author_cache, source)
+        print_authors(table, args.top)
+        return
+
+    if args.db:
+        conn = connect(args.db)
+        if args.store:
+            imported = import_frame(conn, load_snapshots(args.store, args.repo, args.since, args.until), None)
+            print(f"Imported {imported} rows from {args.store}")
+        for filename, parquet in [(args.csv, False), (args.parquet, True)]:
+            if not filename:
+                continue
+            # Rows without a "repo" column belong to --repo, REPO_NAME or else the file's name
+            default_repo = args.repo[0] if args.repo else REPO_NAME or os.path.splitext(os.path.basename(filename))[0]
+            imported = import_frame(conn, fetch_pull_request_data(filename, parse_dates=True, parquet=parquet),
+                                    default_repo, snapshot_time(filename))
+            print(f"Imported {imported} rows from {filename}")
+        print_sql_report(conn, args.repo, args.until, args.top)
+        conn.close()
+        return
+
+    if args.stream:
+        columns = ["repo", *[summary.metric for summary in REPORT_SUMMARIES]]
+        if args.store:
+            print_streaming_report(iter_store_chunks(args.store, columns, args.repo, args.since, args.until))
+        else:
+            print_streaming_report(iter_file_chunks(args.parquet or args.csv, columns, parquet=bool(args.parquet)))
+        return
+
+    # Create a DataFrame
+    columns = list(dict.fromkeys(REPORT_COLUMNS + SCORE_COLUMNS)) if args.score else REPORT_COLUMNS
+    if args.store:
+        pr_df = load_snapshots(args.store, args.repo, args.since, args.until, columns, latest=True)
+    else:
+        pr_df = fetch_pull_request_data(args.parquet or args.csv, columns, parquet=bool(args.parquet))
+    averages, tables = compute_report(pr_df, REPORT_SUMMARIES, REPORT_RANKINGS, args.top)
+    print_report(len(pr_df), averages, tables, args.top)
+    if args.score:
+        print_scores(pr_df, args.weights or DEFAULT_WEIGHTS, args.top)
 
 
     #fig = create_radar_chart(pr_df)
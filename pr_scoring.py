@@ -0,0 +1,59 @@
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from normalization import NormalizationStats, normalize
+from report_engine import top_k
+
+
+# How much each column adds to the priority of a pull request; a negative weight lowers it
+DEFAULT_WEIGHTS = {
+    "time_open_days": 1.0,
+    "lines_changed": 1.0,
+    "changed_files": 0.5,
+    "commits_behind_main": 1.0,
+    "comments": 0.5,
+    "review_comments": 0.5,
+    "is_draft": -1.0,  # Not ready for review yet
+    "is_needs_qa": 0.5,
+}
+SCORE_COLUMNS = list(DEFAULT_WEIGHTS)
+
+
+def parse_weights(text: str) -> Dict[str, float]:
+    """
+    Weights given as "column=weight,..." (e.g. "time_open_days=2,is_draft=0"), over the default ones.
+    """
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in filter(None, text.split(",")):
+        column, _, weight = item.partition("=")
+        if column.strip() not in DEFAULT_WEIGHTS:
+            raise ValueError(f"Unknown score column {column!r}; expected one of {', '.join(SCORE_COLUMNS)}")
+        weights[column.strip()] = float(weight)
+    return weights
+
+
+def score_pull_requests(df: pd.DataFrame, weights: Optional[Dict[str, float]] = None,
+                        stats: Optional[NormalizationStats] = None) -> np.ndarray:
+    """
+    The priority score of each row of df: the weighted mean of its score columns (those df has),
+    each scaled between its 5th and 95th percentiles (the "robust" normalization, missing values
+    as 0), between 0 and 1 when all the weights are positive. The higher, the more a pull request
+    needs attention. With stats (see normalization.fit), the percentiles are taken from those, so
+    that the scores of several snapshots are comparable.
+    """
+    weights = {column: weight for column, weight in (weights or DEFAULT_WEIGHTS).items() if column in df and weight}
+    if not weights:
+        return np.zeros(len(df))
+    scaled = normalize(df, list(weights), "robust", stats).to_numpy()
+    vector = np.fromiter(weights.values(), dtype="float64", count=len(weights))
+    return np.nan_to_num(scaled, nan=0.0) @ vector / np.abs(vector).sum()
+
+
+def top_scored(df: pd.DataFrame, scores: np.ndarray, k: int = 10) -> pd.DataFrame:
+    """
+    The k rows of df with the highest scores (ties in row order), with a "score" column.
+    """
+    selected = top_k(-scores[:, None], k)
+    return df.iloc[selected].assign(score=scores[selected])
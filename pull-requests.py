@@ -1,5 +1,12 @@
+import ast
+import asyncio
 import os
-from datetime import datetime, timezone
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from itertools import islice
 from typing import Dict, List
 
 import argparse  # Add argparse for command-line argument parsing
@@ -7,11 +14,22 @@ import pandas as pd
 from dotenv import load_dotenv
 import json
 import requests  # Import requests for HTTP requests
-from github import Github
+from github import Github, RateLimitExceededException
 from tabulate import tabulate
 import plotly.graph_objects as go
 from tqdm import tqdm  # Add tqdm for progress bar
 
+from github_async import DEFAULT_CONCURRENCY, fetch_pull_requests_async, fetch_repositories_async
+from checkpoint import Checkpoint
+from compare_cache import CompareCache
+from github_graphql import DEFAULT_PARTITION_WORKERS, fetch_pull_request_history, fetch_pull_requests_graphql
+from http_cache import DEFAULT_MAX_BYTES, HttpCache, install_pygithub_transport
+from local_clone import fill_ahead_behind
+from rate_limit import RequestBudget
+from row_writer import DATETIME_COLUMNS, ROW_COLUMNS, ParquetRowWriter, open_row_writer
+from snapshot_store import SnapshotWriter, compact
+from sql_backend import SqliteRowWriter
+
 
 load_dotenv()
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
@@ -19,84 +37,384 @@ REPO_NAME = os.getenv("REPO_NAME")
 MAIN_BRANCH = os.getenv("MAIN_BRANCH", "main")  # Default to "main" if not specified
 
 
-def fetch_pull_requests(repo_name):
+def get_proxies():
     """
-    Fetch all non-closed pull requests from the specified GitHub repository.
+    The proxies to use, from the HTTP_PROXY/HTTPS_PROXY environment variables (or .env file).
     """
-
-    # Configure proxies
-    proxies = {
+    return {
         "http": os.getenv("HTTP_PROXY"),
         "https": os.getenv("HTTPS_PROXY"),
     }
 
-    # Check if proxies are set
-    if proxies["http"] or proxies["https"]:
-        print(f"Using proxies: {json.dumps(proxies, indent=4)}")
-    else:
-        print("No proxies set.")
 
-    # Authenticate with GitHub
-    g = Github(GITHUB_TOKEN)
-    
+_thread_local = threading.local()
+request_budget = RequestBudget()  # Schedules and accounts for every GitHub request of this run
+
+WINDOW_PER_WORKER = 4  # Pull requests per worker thread that may be in flight or waiting to be yielded
+# The columns kept in memory for the chart; every other column only goes to the output file
+CHART_COLUMNS = ["number", "title", "user", "time_open_days", "changed_files", "commits_behind_main", "lines_changed"]
+
+
+def print_budget_summary():
+    # Nothing is accounted for when PyGithub's requests do not go through the budget (see main)
+    if request_budget.requests or request_budget.retries:
+        print(request_budget.summary())
+
+
+def call_with_backoff(func, *args, max_retries=5, **kwargs):
+    """
+    Call func, sleeping and retrying when GitHub reports a primary or secondary rate limit.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except RateLimitExceededException as e:
+            if attempt == max_retries:
+                raise
+            delay = request_budget.retry_delay(e.status, e.headers, attempt, rate_limited=True)
+            tqdm.write(f"Rate limited by GitHub, retrying in {delay}s...")
+            time.sleep(delay)
+
+
+def get_thread_github():
+    """
+    Return the GitHub client owned by the calling thread.
+    A PyGithub client shares one connection object between requests, so it must not be used
+    from several threads at once.
+    """
+    if not hasattr(_thread_local, "github"):
+        _thread_local.github = Github(GITHUB_TOKEN)
+        _thread_local.repos = {}
+    return _thread_local.github
+
+
+def get_thread_repo(repo_name):
+    """
+    Return the repository through a GitHub client owned by the calling thread.
+    """
+    github = get_thread_github()
+    if repo_name not in _thread_local.repos:
+        _thread_local.repos[repo_name] = github.get_repo(repo_name, lazy=True)
+    return _thread_local.repos[repo_name]
+
+
+def process_pull_request(repo, pr, main_branch=MAIN_BRANCH, base_sha=None, compare_cache=None, compare=True):
+    """
+    Compare a pull request with the main branch and build its row of metadata.
+    Reading the detail fields (additions, comments, ...) lazily loads the full PR.
+    With a compare cache, the comparison is looked up by the SHA of the main branch
+    (base_sha) and of the PR head, and only requested from GitHub on a miss.
+    If compare is False, the commits behind/ahead are left empty to be filled in later.
+    """
+    # Compare the PR branch with the main branch
+    # This will raise an error if the branches are not comparable
+    # Handle the case where the PR is from a fork
+
+    is_forked = pr.head.repo.fork  # Whether the PR is from a forked repo
+    comparison = None
+    if compare and not is_forked and compare_cache:
+        comparison = compare_cache.get(base_sha, pr.head.sha)
+    if compare and not is_forked and comparison is None:
+        try:
+            # Check that the named branch exists in this repo, then compare with main dev branch
+            repo.get_branch(pr.head.ref)
+            if compare_cache:
+                # Compare the exact commits the cache entry is keyed by
+                result = repo.compare(base_sha, pr.head.sha)
+                compare_cache.put(base_sha, pr.head.sha, result.behind_by, result.ahead_by)
+            else:
+                result = repo.compare(main_branch, pr.head.ref)
+            comparison = (result.behind_by, result.ahead_by)
+        except RateLimitExceededException:
+            raise
+        except Exception as e:
+            print(f"PR#{pr.id}: [{pr.title}]\n\tError fetching branch [{pr.head.ref}] - may have come from a forked repo:\n\t{e}")
+
+    time_open = (pr.closed_at or datetime.now(timezone.utc)) - pr.created_at  # Time open until closed (or now)
+
+    pr_data = {
+        "id": pr.id,
+        "number": pr.number,
+        "title": pr.title,
+        "user": pr.user.login,
+        "state": pr.state,
+        "created_at": pr.created_at,
+        "updated_at": pr.updated_at,
+        "closed_at": pr.closed_at,
+        "merged_at": pr.merged_at,
+        "merge_commit_sha": pr.merge_commit_sha,
+        "additions": pr.additions,
+        "deletions": pr.deletions,
+        "changed_files": pr.changed_files,
+        "comments": pr.comments,
+        "review_comments": pr.review_comments,
+        "labels": [label.name for label in pr.labels],
+        "num_labels": len(pr.labels),
+        "review_comments": pr.review_comments,
+        "commits_behind_main": comparison[0] if comparison else None,
+        "commits_ahead_main": comparison[1] if comparison else None,
+        "lines_changed": pr.additions + pr.deletions,  # Total lines changed
+        "time_open_days": time_open.days,  # Time open in days
+        "is_merged": pr.merged_at is not None,  # Whether the PR is merged
+        "is_forked": is_forked,  # Whether the PR is from a forked repo
+        "source_repo": pr.head.repo.full_name if is_forked else None,  # Source repository name if forked
+        "is_draft": pr.draft,  # Whether the PR is a draft
+        "is_locked": pr.locked,  # Whether the PR is locked
+        "is_needs_qa": any(label.name.lower() == "needs qa" for label in pr.labels),  # Check for needs QA label
+    }
+    return pr_data
+
+
+def process_with_checkpoint(checkpoint, repo_name, number, process):
+    """
+    Return the checkpointed row of a pull request, or call process() and checkpoint its new row.
+    """
+    row = checkpoint.get(repo_name, number) if checkpoint else None
+    if row is None:
+        row = process()
+        if checkpoint:
+            checkpoint.append(repo_name, row)
+    return row
+
+
+def process_pull_requests_concurrently(repo_name, pull_requests, total, main_branch, workers, base_sha=None,
+                                       compare_cache=None, compare=True, checkpoint=None):
+    """
+    Process the listed pull requests on a bounded thread pool. Each worker re-reads its PR
+    through its own GitHub client, and the rows are yielded in the listing order. At most
+    WINDOW_PER_WORKER pull requests per worker are in flight or waiting to be yielded.
+    """
+    def process(number):
+        repo = get_thread_repo(repo_name)
+        return call_with_backoff(
+            lambda: process_pull_request(repo, repo.get_pull(number), main_branch, base_sha, compare_cache, compare)
+        )
+
+    # The bar advances as each PR completes, while later pages of the listing are still being fetched
+    with tqdm(total=total, desc="Processing Pull Requests", unit="PR") as progress:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            window = deque()
+            listed = 0
+            for pr in pull_requests:
+                future = executor.submit(process_with_checkpoint, checkpoint, repo_name, pr.number,
+                                         lambda number=pr.number: process(number))
+                future.add_done_callback(lambda _: progress.update(1))
+                window.append(future)
+                listed += 1
+                # Hand on the finished rows at the front, and wait for the oldest once the window is full
+                while window and (window[0].done() or len(window) >= workers * WINDOW_PER_WORKER):
+                    yield window.popleft().result()
+            progress.total = listed  # The listing may have changed since the total was read
+            while window:
+                yield window.popleft().result()
+
+
+def load_snapshot(filename: str) -> List[Dict]:
+    """
+    Load the rows of a previously saved CSV of pull-requests, restoring what the CSV
+    loses: datetimes, label lists and missing values.
+    """
+    df = pd.read_csv(filename)
+    for column in ["created_at", "updated_at", "closed_at", "merged_at"]:
+        df[column] = pd.to_datetime(df[column], utc=True)
+    df["labels"] = df["labels"].apply(ast.literal_eval)
+    for column in ["commits_behind_main", "commits_ahead_main"]:
+        df[column] = df[column].astype("Int64")  # Stored as floats when some values are missing
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict("records")
+
+
+def list_updated_pull_requests(repo, previous_rows):
+    """
+    List the pull requests updated since a previous snapshot, most recently updated first,
+    and stop paginating at the first PR that has not changed since. Returns the open PRs
+    to refresh and the numbers of the PRs that have been closed in the meantime.
+    """
+    cutoff = max(row["updated_at"] for row in previous_rows)
+    open_prs, closed_numbers = [], set()
+    for pr in repo.get_pulls(state="all", sort="updated", direction="desc"):
+        if pr.updated_at < cutoff:
+            break
+        if pr.state == "open":
+            open_prs.append(pr)
+        else:
+            closed_numbers.add(pr.number)
+    return open_prs, closed_numbers
+
+
+def merge_snapshot_rows(pr_list, previous_rows, closed_numbers):
+    """
+    Add the unchanged rows of a previous snapshot to the refreshed rows, updating only their
+    time open, and drop the PRs closed since the snapshot.
+    """
+    refreshed = {row["number"] for row in pr_list} | closed_numbers
+    now = datetime.now(timezone.utc)
+    for row in previous_rows:
+        if row["number"] not in refreshed:
+            pr_list.append({**row, "time_open_days": (now - row["created_at"]).days})
+
+    # Same order as a full listing: newest PR first
+    return sorted(pr_list, key=lambda row: row["created_at"], reverse=True)
+
+
+def fetch_pull_requests_rest(g, repo_name, main_branch, workers=1, previous_rows=None, compare_cache=None, compare=True,
+                             checkpoint=None):
+    """
+    Fetch the open pull requests with the REST API, one detail (and comparison) lookup per PR,
+    and yield their rows as they complete. PRs already in the checkpoint are not looked up again.
+    """
     repo = g.get_repo(repo_name)
 
-    # Fetch only open pull requests
-    pull_requests = repo.get_pulls(state="open")  # Only fetch open PRs
-    pr_list = []
-    print(f"Fetched {pull_requests.totalCount} pull requests from {repo_name}")
-
-    # Use tqdm to display a progress bar
-    for pr in tqdm(pull_requests, desc="Processing Pull Requests", unit="PR"):
-        # Compare the PR branch with the main branch
-        # This will raise an error if the branches are not comparable
-        # Handle the case where the PR is from a fork
-
-        is_forked = pr.head.repo.fork  # Whether the PR is from a forked repo
-        comparison = None
-        if not is_forked:
-            try:
-                # Check that the named branch exists in this repo, then compare with main dev branch
-                repo.get_branch(pr.head.ref)
-                comparison = repo.compare(MAIN_BRANCH, pr.head.ref)
-            except Exception as e:
-                print(f"PR#{pr.id}: [{pr.title}]\n\tError fetching branch [{pr.head.ref}] - may have come from a forked repo:\n\t{e}")
-
-        time_open = datetime.now(timezone.utc) - pr.created_at  # Time open until now
-
-        pr_data = {
-            "id": pr.id,
-            "number": pr.number,
-            "title": pr.title,
-            "user": pr.user.login,
-            "state": pr.state,
-            "created_at": pr.created_at,
-            "updated_at": pr.updated_at,
-            "closed_at": pr.closed_at,
-            "merged_at": pr.merged_at,
-            "merge_commit_sha": pr.merge_commit_sha,
-            "additions": pr.additions,
-            "deletions": pr.deletions,
-            "changed_files": pr.changed_files,
-            "comments": pr.comments,
-            "review_comments": pr.review_comments,
-            "labels": [label.name for label in pr.labels],
-            "num_labels": len(pr.labels),
-            "review_comments": pr.review_comments,
-            "commits_behind_main": comparison.behind_by if comparison else None,
-            "commits_ahead_main": comparison.ahead_by if comparison else None,
-            "lines_changed": pr.additions + pr.deletions,  # Total lines changed
-            "time_open_days": time_open.days,  # Time open in days
-            "is_merged": pr.merged_at is not None,  # Whether the PR is merged
-            "is_forked": is_forked,  # Whether the PR is from a forked repo
-            "source_repo": pr.head.repo.full_name if is_forked else None,  # Source repository name if forked
-            "is_draft": pr.draft,  # Whether the PR is a draft
-            "is_locked": pr.locked,  # Whether the PR is locked
-            "is_needs_qa": any(label.name.lower() == "needs qa" for label in pr.labels),  # Check for needs QA label
-        }
-        pr_list.append(pr_data)
-
-    return pr_list
+    if previous_rows is None:
+        # Fetch only open pull requests
+        pull_requests = repo.get_pulls(state="open")  # Only fetch open PRs
+        total = pull_requests.totalCount
+        print(f"Fetched {total} pull requests from {repo_name}")
+    else:
+        pull_requests, closed_numbers = list_updated_pull_requests(repo, previous_rows)
+        total = len(pull_requests)
+        print(f"Fetched {total} pull requests updated since the snapshot from {repo_name}")
+
+    # The comparisons are keyed by the commit main currently points at
+    base_sha = repo.get_branch(main_branch).commit.sha if compare and compare_cache else None
+
+    if workers > 1:
+        rows = process_pull_requests_concurrently(repo_name, pull_requests, total, main_branch, workers, base_sha,
+                                                  compare_cache, compare, checkpoint)
+    else:
+        # Use tqdm to display a progress bar
+        rows = (
+            process_with_checkpoint(
+                checkpoint, repo_name, pr.number,
+                lambda: call_with_backoff(process_pull_request, repo, pr, main_branch, base_sha, compare_cache, compare),
+            )
+            for pr in tqdm(pull_requests, total=total, desc="Processing Pull Requests", unit="PR")
+        )
+
+    if previous_rows is not None:
+        # Merged with the snapshot (already in memory) and sorted, so collected first
+        yield from merge_snapshot_rows(list(rows), previous_rows, closed_numbers)
+    else:
+        yield from rows
+
+
+def fetch_pull_requests(repo_name, main_branch=MAIN_BRANCH, use_graphql=False, use_async=False, workers=1, cache=None,
+                        previous_rows=None, compare_cache=None, local_clone=None, checkpoint=None):
+    """
+    Fetch all non-closed pull requests from the specified GitHub repository, and return an
+    iterator of their rows that fetches them as it is consumed.
+    If use_graphql is set, the PRs are fetched in pages of 100 with the GraphQL API
+    instead of several REST calls per PR. If use_async is set, the REST calls are
+    pipelined over one pooled HTTP/2 connection. With more than one worker, the per-PR
+    comparisons and detail loads run concurrently. If an HttpCache is given, the async engine
+    revalidates its responses against it (PyGithub uses the one installed by
+    install_pygithub_transport). If the rows of a previous
+    snapshot are given, only the PRs updated since that snapshot are fetched again.
+    With a CompareCache, branch comparisons are reused while neither branch has moved.
+    If local_clone is the path of a (to be created) bare mirror, the commits behind/ahead
+    are counted there for every PR, forks included, instead of with the compare API.
+    Each completed row is streamed to the checkpoint, and PRs already in it are skipped.
+    """
+    compare = local_clone is None  # The local mirror replaces the compare API
+    if use_async:
+        concurrency = workers if workers > 1 else DEFAULT_CONCURRENCY
+        rows = asyncio.run(fetch_pull_requests_async(repo_name, main_branch, GITHUB_TOKEN, get_proxies(), request_budget,
+                                                        concurrency, cache, compare_cache, compare, checkpoint))
+    else:
+        # Authenticate with GitHub
+        g = Github(GITHUB_TOKEN)
+
+        if use_graphql:
+            rows = fetch_pull_requests_graphql(g, repo_name, main_branch, compare=compare, checkpoint=checkpoint)
+        else:
+            rows = fetch_pull_requests_rest(g, repo_name, main_branch, workers, previous_rows, compare_cache, compare,
+                                            checkpoint)
+
+    if local_clone:
+        rows = fill_ahead_behind(rows, local_clone, repo_name, GITHUB_TOKEN, main_branch)
+
+    return rows
+
+
+def list_repositories(org=None, repos_file=None):
+    """
+    The repositories to scan, mapped to their default branch: every repository (that is not
+    archived) of a GitHub organisation and/or the 'owner/repo' lines of a file.
+    """
+    g = Github(GITHUB_TOKEN)
+    repo_branches = {}
+    if org:
+        for repo in g.get_organization(org).get_repos():
+            if not repo.archived:
+                repo_branches[repo.full_name] = repo.default_branch
+    if repos_file:
+        with open(repos_file, "r") as f:
+            for line in f:
+                name = line.split("#", 1)[0].strip()  # Allow comments and blank lines
+                if name and name not in repo_branches:
+                    repo_branches[name] = g.get_repo(name).default_branch
+    return repo_branches
+
+
+def fetch_repositories(repo_branches, use_graphql=False, use_async=False, workers=1, repo_workers=4, cache=None,
+                       previous_rows=None, compare_cache=None, local_clone=None, checkpoint=None):
+    """
+    Scan several repositories (mapped to their main branch) in one process and yield their
+    combined rows, with a "repo" column first. The repositories are fetched concurrently and
+    share the connection pool and the request budget; the async engine runs them all on one
+    event loop and HTTP/2 client. With local_clone, each repository gets its own mirror
+    under that directory. On threads, a repository is only started once one of the
+    repo_workers before it has been handed on, so at most repo_workers + 1 repositories' rows
+    are held in memory; the async engine returns the rows of all the repositories at once.
+    """
+    def mirror_path(repo_name):
+        return os.path.join(local_clone, repo_name.replace("/", "__")) if local_clone else None
+
+    if use_async:
+        concurrency = workers if workers > 1 else DEFAULT_CONCURRENCY
+        results = asyncio.run(fetch_repositories_async(repo_branches, GITHUB_TOKEN, get_proxies(), request_budget,
+                                                       concurrency, cache, compare_cache, local_clone is None, checkpoint))
+        for repo_name, rows in results.items():
+            if local_clone:
+                rows = fill_ahead_behind(rows, mirror_path(repo_name), repo_name, GITHUB_TOKEN, repo_branches[repo_name])
+            for row in rows:
+                yield {"repo": repo_name, **row}
+    else:
+        def fetch(repo_name):
+            # A combined snapshot holds the previous rows of every repository
+            previous = [row for row in previous_rows if row.get("repo") == repo_name] if previous_rows else None
+            return list(fetch_pull_requests(repo_name, repo_branches[repo_name], use_graphql=use_graphql, workers=workers,
+                                            previous_rows=previous or None, compare_cache=compare_cache,
+                                            local_clone=mirror_path(repo_name), checkpoint=checkpoint))
+
+        with ThreadPoolExecutor(max_workers=repo_workers) as executor:
+            # Each repository's rows are handed on (and released) in turn, and the next repository
+            # is only submitted then, so finished ones do not pile up behind a slow one
+            names = iter(repo_branches)
+            window = deque((repo_name, executor.submit(fetch, repo_name)) for repo_name in islice(names, repo_workers))
+            while window:
+                repo_name, future = window.popleft()
+                rows = future.result()
+                next_name = next(names, None)
+                if next_name is not None:
+                    window.append((next_name, executor.submit(fetch, next_name)))
+                for row in rows:
+                    yield {"repo": repo_name, **row}
+                del rows
+
+
+def backfill_pull_requests(repo_names, filename, workers=1, since=None):
+    """
+    Fetch the whole history (open, closed and merged PRs) of each repository and stream it to a
+    Parquet file, with a "repo" column first when there are several repositories. The date
+    ranges of each repository's history are searched on parallel threads.
+    """
+    workers = workers if workers > 1 else DEFAULT_PARTITION_WORKERS
+    with ParquetRowWriter(filename) as writer:
+        for repo_name in repo_names:
+            for row in fetch_pull_request_history(get_thread_github, repo_name, since=since, workers=workers):
+                writer.write({"repo": repo_name, **row} if len(repo_names) > 1 else row)
+    print(f"Pull request history ({writer.rows} pull requests) saved to {filename}")
 
 
 
@@ -158,10 +476,9 @@ def create_dataframe(pr_list: List[Dict]) -> pd.DataFrame:
     # Convert the list of dictionaries to a DataFrame
     pr_df = pd.DataFrame(pr_list)
     # Convert datetime columns to pandas datetime
-    pr_df["created_at"] = pd.to_datetime(pr_df["created_at"])
-    pr_df["updated_at"] = pd.to_datetime(pr_df["updated_at"])
-    pr_df["closed_at"] = pd.to_datetime(pr_df["closed_at"])
-    pr_df["merged_at"] = pd.to_datetime(pr_df["merged_at"])
+    for column in DATETIME_COLUMNS:
+        if column in pr_df:
+            pr_df[column] = pd.to_datetime(pr_df[column])
 
     # Print this out in a table using tabulate
     print( tabulate(pr_df, headers="keys", tablefmt="pipe") )
@@ -184,9 +501,36 @@ def main():
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description="Fetch and analyze GitHub pull requests.")
     parser.add_argument("--repo", type=str, help="GitHub repository name (e.g., 'owner/repo').")
+    parser.add_argument("--org", type=str, help="Scan every repository of this GitHub organisation.")
+    parser.add_argument("--repos-file", type=str, help="Scan the repositories listed (one 'owner/repo' per line) in this file.")
+    parser.add_argument("--repo-workers", type=int, default=4, help="Number of repositories to scan concurrently (default 4).")
     parser.add_argument("--branch", type=str, help="Main branch name to compare against (if other than 'main').")
     parser.add_argument("--csv", type=str, help="Save CSV file of pull-requests.")
+    parser.add_argument("--parquet", type=str, help="Save Parquet file of pull-requests (typed, compact columns).")
+    parser.add_argument("--store", type=str, help="Append this run as a new capture to the snapshot store in this directory.")
+    parser.add_argument("--db", type=str, help="Insert this run as a new capture into this SQLite database (see pr-graphs.py --db).")
+    parser.add_argument("--compact", action="store_true", help="Compact the --store (latest captures in full) instead of fetching.")
+    parser.add_argument("--compact-before", type=date.fromisoformat, help="With --compact, fold the captures before this date (YYYY-MM-DD) into one.")
+    parser.add_argument("--graphql", action="store_true", help="Fetch pull-requests in bulk with the GraphQL API.")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Fetch pull-requests with the asyncio HTTP/2 engine.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of pull-requests (or, with --async, requests) to process concurrently.")
+    parser.add_argument("--cache-dir", type=str, help="Directory of cached GitHub responses, revalidated with ETags.")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024), help="Maximum size of the response cache in MB.")
+    parser.add_argument("--since-snapshot", type=str, help="CSV file of a previous run; only PRs updated since then are fetched.")
+    parser.add_argument("--local-clone", type=str, help="Path of a bare mirror (with --org/--repos-file, a directory of mirrors) used to count commits behind/ahead locally.")
+    parser.add_argument("--checkpoint", type=str, help="Checkpoint file of completed pull-requests (default: <csv>.checkpoint.jsonl).")
+    parser.add_argument("--resume", action="store_true", help="Resume an interrupted run from its checkpoint file.")
+    parser.add_argument("--no-chart", action="store_true", help="Only write the output file; do not print the table or show the chart.")
+    parser.add_argument("--backfill", type=str, help="Fetch the whole history (open, closed and merged pull-requests) into this Parquet file.")
+    parser.add_argument("--backfill-since", type=str, help="With --backfill, only pull-requests created since this date (YYYY-MM-DD).")
     args = parser.parse_args()
+    if args.since_snapshot and (args.graphql or args.use_async):
+        parser.error("--since-snapshot is only supported by the default REST engine")
+    if args.compact:
+        if not args.store:
+            parser.error("--compact needs --store")
+        compact(args.store, [args.repo] if args.repo else None, args.compact_before)
+        return
 
     # Override environment variables with command-line arguments if provided
     repo_name = args.repo if args.repo else REPO_NAME
@@ -197,23 +541,102 @@ def main():
         print("Error: Missing GITHUB_TOKEN (via .env file)")
         return
 
-    print("GitHub credentials and repository name loaded successfully.")
-    print(f"Repository: {repo_name}")
-    print(f"Main Branch: {main_branch}")
+    # Configure proxies
+    proxies = get_proxies()
 
-    # Fetch non-closed pull requests
-    pr_list = fetch_pull_requests(repo_name)
+    # Check if proxies are set
+    if proxies["http"] or proxies["https"]:
+        print(f"Using proxies: {json.dumps(proxies, indent=4)}")
+    else:
+        print("No proxies set.")
 
-    # Create a DataFrame
-    pr_df = create_dataframe(pr_list)
+    cache = HttpCache(args.cache_dir, args.cache_max_mb * 1024 * 1024) if args.cache_dir else None
+    multi_repo = bool(args.org or args.repos_file)
+    if cache or args.workers > 1 or multi_repo:
+        # All PyGithub clients share the request budget, the cache and one pool of connections. Only
+        # installed when there is a cache or concurrent requests to pace, as it relies on PyGithub
+        # internals; a plain run uses PyGithub as it is (with call_with_backoff on rate limits).
+        install_pygithub_transport(cache, request_budget, pool_size=max(10, args.workers * args.repo_workers))
+
+    if multi_repo:
+        repo_branches = list_repositories(args.org, args.repos_file)
+        if args.branch:
+            repo_branches = {name: args.branch for name in repo_branches}
+        print("GitHub credentials and repository names loaded successfully.")
+        print(f"Repositories: {len(repo_branches)}")
+    else:
+        print("GitHub credentials and repository name loaded successfully.")
+        print(f"Repository: {repo_name}")
+        print(f"Main Branch: {main_branch}")
+
+    if args.backfill:
+        since = datetime.fromisoformat(args.backfill_since).replace(tzinfo=timezone.utc) if args.backfill_since else None
+        try:
+            backfill_pull_requests(list(repo_branches) if multi_repo else [repo_name], args.backfill, args.workers, since)
+        finally:
+            print_budget_summary()
+        return
 
-    # Save the DataFrame to a CSV file
+    # Branch comparisons are memoised next to the cached responses
+    compare_cache = CompareCache(os.path.join(args.cache_dir, "compare-cache.json")) if args.cache_dir else None
+    # Every completed row is streamed to the checkpoint, so an interrupted run can be resumed
+    checkpoint = Checkpoint(args.checkpoint or f"{args.csv or args.parquet or 'pull-requests'}.checkpoint.jsonl",
+                            resume=args.resume)
+    previous_rows = load_snapshot(args.since_snapshot) if args.since_snapshot else None
+    if previous_rows == []:
+        previous_rows = None  # Nothing to build on, so fetch everything
+
+    # Fetch non-closed pull requests, streaming each row to the output files and keeping only what the chart needs
+    writers = []
+    # Given upfront, so that a run without any pull requests still replaces the files of an earlier one
+    columns = [*(["repo"] if multi_repo else []), *ROW_COLUMNS]
     if args.csv:
-        pr_df.to_csv(args.csv, index=False)
-        print(f"Pull requests saved to {args.csv}")
-
-    # Visualize the pull requests
-    visualize_pull_requests(pr_df)
+        writers.append(open_row_writer(args.csv, columns=columns))
+    if args.parquet:
+        writers.append(ParquetRowWriter(args.parquet, columns=columns))
+    if args.store:
+        writers.append(SnapshotWriter(args.store, None if multi_repo else repo_name,
+                                      repos=list(repo_branches) if multi_repo else None))
+    if args.db:
+        writers.append(SqliteRowWriter(args.db, None if multi_repo else repo_name,
+                                       repos=list(repo_branches) if multi_repo else None))
+    chart_rows = []
+    try:
+        if multi_repo:
+            rows = fetch_repositories(repo_branches, use_graphql=args.graphql, use_async=args.use_async,
+                                      workers=args.workers, repo_workers=args.repo_workers, cache=cache,
+                                      previous_rows=previous_rows, compare_cache=compare_cache,
+                                      local_clone=args.local_clone, checkpoint=checkpoint)
+        else:
+            rows = fetch_pull_requests(repo_name, main_branch, use_graphql=args.graphql, use_async=args.use_async,
+                                       workers=args.workers, cache=cache, previous_rows=previous_rows,
+                                       compare_cache=compare_cache, local_clone=args.local_clone,
+                                       checkpoint=checkpoint)
+        for row in rows:
+            for writer in writers:
+                writer.write(row)
+            if not args.no_chart:
+                chart_rows.append({column: row[column] for column in CHART_COLUMNS})
+    except BaseException:
+        # Leave no partial capture or file behind; the checkpoint keeps the rows for --resume
+        for writer in writers:
+            writer.abort()
+        raise
+    else:
+        for writer in writers:
+            writer.close()
+            print(f"Pull requests saved to {writer.path}")
+    finally:
+        # Keep what was learnt even if the run was interrupted
+        if compare_cache:
+            compare_cache.save()
+        print_budget_summary()
+    checkpoint.remove()  # The run is complete, so there is nothing left to resume
+
+    if not args.no_chart:
+        # Create a DataFrame and visualize the pull requests
+        pr_df = create_dataframe(chart_rows)
+        visualize_pull_requests(pr_df)
 
 if __name__ == "__main__":
     main()
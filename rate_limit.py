@@ -0,0 +1,191 @@
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import requests
+
+
+# Request priorities: when a budget runs low, LOW requests wait for the reset so that the
+# remaining requests go to the cheap listing and detail calls
+NORMAL = 0
+LOW = 1
+
+DEFAULT_RESERVE = 100  # Requests per resource kept back for NORMAL priority requests
+PACE_FRACTION = 0.2  # Start spreading requests out once less than this fraction of the limit remains
+
+
+def resource_for(url: str) -> str:
+    """
+    The GitHub rate-limit resource ("core", "graphql", "search") a request URL is charged to.
+    """
+    if "/graphql" in url:
+        return "graphql"
+    if "/search/" in url:
+        return "search"
+    return "core"
+
+
+def priority_for(url: str) -> int:
+    """
+    Branch comparisons are the most expensive calls, so they give way to everything else.
+    """
+    return LOW if "/compare/" in url else NORMAL
+
+
+class ResourceLimit:
+    """
+    Last known state of one rate-limit resource (as reported by the headers), the requests sent
+    but not answered yet, and the pacing slot of the next request.
+    """
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.in_flight = 0
+        self.next_slot = 0.0
+
+
+class RequestBudget:
+    """
+    Central scheduler of GitHub API requests. It follows the X-RateLimit-* headers of every
+    response, paces requests so the remaining budget lasts until the reset, makes requests
+    wait for the reset once a budget is spent (LOW priority ones already when only the
+    reserve is left), decides how long to back off from secondary rate limits, and keeps
+    the counts for a per-run summary.
+    """
+
+    def __init__(self, reserve: int = DEFAULT_RESERVE):
+        self.reserve = reserve
+        self.lock = threading.Lock()
+        self.resources: Dict[str, ResourceLimit] = {}
+        self.requests = 0
+        self.not_modified = 0
+        self.retries = 0
+        self.waited = 0.0
+
+    def acquire(self, url: str) -> float:
+        """
+        Reserve a slot for a request to url and return how many seconds to wait before sending it.
+        The reservation lasts until the response is recorded (or the request released).
+        """
+        priority = priority_for(url)
+        with self.lock:
+            state = self.resources.setdefault(resource_for(url), ResourceLimit())
+            now = time.time()
+            available = None if state.remaining is None else state.remaining - state.in_flight
+            state.in_flight += 1
+            if available is None or state.reset is None:
+                return 0.0  # Nothing known until the first response
+            if state.reset <= now:
+                state.remaining = None  # The budget has been restored; wait for fresh headers
+                return 0.0
+
+            if available <= 0 or (priority == LOW and available <= self.reserve):
+                delay = state.reset - now + 1
+            else:
+                interval = 0.0
+                if available < state.limit * PACE_FRACTION:
+                    # Spread what is left evenly over the time until the reset
+                    interval = (state.reset - now) / available
+                start = max(now, state.next_slot)
+                state.next_slot = start + interval
+                delay = start - now
+
+            self.waited += delay
+            return delay
+
+    def release(self, url: str):
+        """
+        End the reservation of a request to url, once answered or failed.
+        """
+        with self.lock:
+            state = self.resources.setdefault(resource_for(url), ResourceLimit())
+            state.in_flight = max(0, state.in_flight - 1)
+
+    def wait(self, url: str):
+        """
+        Block the calling thread until a request to url may be sent.
+        """
+        delay = self.acquire(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    def record(self, url: str, status: int, headers):
+        """
+        Account for a response (ending its reservation) and update the rate-limit state from its
+        headers. Only the headers lower the remaining budget, so conditional requests answered
+        "304 Not Modified", which GitHub does not charge for, cost nothing.
+        """
+        self.release(url)
+        headers = {k.lower(): v for k, v in headers.items()}
+        with self.lock:
+            self.requests += 1
+            if status == 304:
+                self.not_modified += 1
+            if "x-ratelimit-remaining" not in headers:
+                return
+            state = self.resources.setdefault(headers.get("x-ratelimit-resource", resource_for(url)), ResourceLimit())
+            reset = int(headers["x-ratelimit-reset"])
+            remaining = int(headers["x-ratelimit-remaining"])
+            # Concurrent responses may arrive out of order: within one window, the lowest reported count is the latest
+            if state.reset is None or reset > state.reset or state.remaining is None or remaining < state.remaining:
+                state.remaining = remaining
+            state.reset = reset
+            state.limit = int(headers["x-ratelimit-limit"])
+
+    def retry_delay(self, status: int, headers, attempt: int, rate_limited: bool = False) -> Optional[float]:
+        """
+        How long to wait before retrying a rejected request, or None if it was not rate limited.
+        rate_limited says the caller already knows it was (e.g. from the exception type).
+        """
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if headers.get("retry-after"):
+            # Secondary rate limit: GitHub tells us how long to wait
+            delay = int(headers["retry-after"])
+        elif headers.get("x-ratelimit-remaining") == "0":
+            # Primary rate limit: wait until the quota resets
+            delay = max(0, int(headers["x-ratelimit-reset"]) - int(time.time())) + 1
+        elif rate_limited or status == 429:
+            delay = min(60, 5 * 2 ** attempt)
+        else:
+            return None
+
+        with self.lock:
+            self.retries += 1
+            self.waited += delay
+        return delay
+
+    def summary(self) -> str:
+        lines = [
+            f"GitHub API budget: {self.requests} requests, {self.not_modified} answered '304 Not Modified', "
+            f"{self.retries} retries, {self.waited:.1f}s spent waiting for rate limits"
+        ]
+        for name, state in sorted(self.resources.items()):
+            if state.remaining is not None:
+                reset = datetime.fromtimestamp(state.reset).strftime("%H:%M:%S")
+                lines.append(f"  {name}: {state.remaining}/{state.limit} remaining, resets at {reset}")
+        return "\n".join(lines)
+
+
+class BudgetAdapter(requests.adapters.HTTPAdapter):
+    """
+    requests transport adapter that sends every request through a RequestBudget.
+    """
+
+    def __init__(self, budget: Optional[RequestBudget] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.budget = budget
+
+    def send(self, request, **kwargs):
+        if self.budget is None:
+            return super().send(request, **kwargs)
+        self.budget.wait(request.url)
+        try:
+            response = super().send(request, **kwargs)
+        except Exception:
+            self.budget.release(request.url)
+            raise
+        self.budget.record(request.url, response.status_code, response.headers)
+        return response
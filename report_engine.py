@@ -0,0 +1,83 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class Ranking(NamedTuple):
+    """
+    A top-k table of a report: the first k rows ordered by the order_by columns.
+    With skip_missing, rows missing the first order_by column are left out (like
+    DataFrame.nsmallest/nlargest); otherwise missing values sort last (like sort_values).
+    """
+    title: str  # May refer to {k}
+    order_by: List[str]
+    columns: List[str]
+    descending: bool = False
+    k: int = 10
+    skip_missing: bool = True
+
+
+class Summary(NamedTuple):
+    """
+    A mean printed in a report, as '<label>: <mean><unit>'.
+    """
+    label: str
+    metric: str
+    unit: str = ""
+
+
+def sort_keys(matrix: np.ndarray, descending: bool) -> np.ndarray:
+    """
+    Keys that order the rows of matrix ascending, with missing values last.
+    """
+    keys = -matrix if descending else matrix.copy()
+    keys[np.isnan(keys)] = np.inf
+    return keys
+
+
+def top_k(keys: np.ndarray, k: int) -> np.ndarray:
+    """
+    The positions of the first k rows ordered by the key columns (lexicographically), ties in
+    row order. Only the rows whose first key is within the k smallest are sorted: these are
+    found with a linear-time partition rather than by sorting every row.
+    """
+    n = len(keys)
+    if k < n:
+        threshold = np.partition(keys[:, 0], k - 1)[k - 1]
+        candidates = np.flatnonzero(keys[:, 0] <= threshold)
+    else:
+        candidates = np.arange(n)
+    # np.lexsort sorts by the last key first; the row position breaks ties
+    order = np.lexsort((candidates, *keys[candidates].T[::-1]))
+    return candidates[order[:k]]
+
+
+def compute_report(df: pd.DataFrame, summaries: List[Summary], rankings: List[Ranking],
+                   k: Optional[int] = None) -> Tuple[Dict[str, float], List[pd.DataFrame]]:
+    """
+    Compute the means and the rankings of a report over df in one pass: every metric used is
+    converted once into a single float matrix, the means are taken column-wise over it, and each
+    ranking is a top-k selection over its columns. k overrides the k of every ranking.
+    Returns the means by metric and the ranking tables (rows of df, with its index).
+    """
+    metrics = list(dict.fromkeys([summary.metric for summary in summaries] +
+                                 [column for ranking in rankings for column in ranking.order_by]))
+    matrix = df[metrics].to_numpy(dtype="float64", na_value=np.nan)
+    positions = {metric: position for position, metric in enumerate(metrics)}
+
+    present = ~np.isnan(matrix)
+    with np.errstate(invalid="ignore"):
+        means = np.where(present, matrix, 0).sum(axis=0) / present.sum(axis=0)  # NaN if none present
+    averages = {summary.metric: means[positions[summary.metric]] for summary in summaries}
+
+    tables = []
+    for ranking in rankings:
+        keys = sort_keys(matrix[:, [positions[column] for column in ranking.order_by]], ranking.descending)
+        rows = np.arange(len(df))
+        if ranking.skip_missing:
+            rows = np.flatnonzero(~np.isnan(matrix[:, positions[ranking.order_by[0]]]))
+            keys = keys[rows]
+        selected = rows[top_k(keys, k or ranking.k)] if len(rows) else rows
+        tables.append(df.iloc[selected][ranking.columns])
+    return averages, tables
@@ -0,0 +1,183 @@
+import abc
+import os
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+CHUNK_ROWS = 1000  # Rows buffered before they are written out
+DATETIME_COLUMNS = ["created_at", "updated_at", "closed_at", "merged_at"]
+
+TIMESTAMP = pa.timestamp("us", tz="UTC")
+CATEGORY = pa.dictionary(pa.int32(), pa.string())  # Few distinct values, each stored once per row group
+
+# Explicit schema of the pull-request rows written to Parquet; a column not listed here is written as a string
+ROW_SCHEMA = pa.schema([
+    ("repo", CATEGORY),
+    ("id", pa.int64()),
+    ("number", pa.int32()),
+    ("title", pa.string()),
+    ("user", CATEGORY),
+    ("state", CATEGORY),
+    ("created_at", TIMESTAMP),
+    ("updated_at", TIMESTAMP),
+    ("closed_at", TIMESTAMP),
+    ("merged_at", TIMESTAMP),
+    ("merge_commit_sha", pa.string()),
+    ("additions", pa.int32()),
+    ("deletions", pa.int32()),
+    ("changed_files", pa.int32()),
+    ("comments", pa.int32()),
+    ("review_comments", pa.int32()),
+    ("labels", pa.list_(pa.string())),
+    ("num_labels", pa.int32()),
+    ("commits_behind_main", pa.int32()),
+    ("commits_ahead_main", pa.int32()),
+    ("lines_changed", pa.int32()),
+    ("time_open_days", pa.int32()),
+    ("is_merged", pa.bool_()),
+    ("is_forked", pa.bool_()),
+    ("source_repo", CATEGORY),
+    ("is_draft", pa.bool_()),
+    ("is_locked", pa.bool_()),
+    ("is_needs_qa", pa.bool_()),
+    ("captured_at", TIMESTAMP),  # Snapshot store only
+    ("removed", pa.bool_()),  # Snapshot store deltas only
+])
+
+# The columns of a fetched row, in order (after "repo" when several repositories are fetched)
+ROW_COLUMNS = [name for name in ROW_SCHEMA.names if name not in ("repo", "captured_at", "removed")]
+
+# Integer columns; written to CSV as nullable integers so that a chunk with a missing value
+# does not turn the column into floats ("5.0")
+COUNTER_COLUMNS = [field.name for field in ROW_SCHEMA if pa.types.is_integer(field.type)]
+
+
+def schema_for(columns) -> pa.Schema:
+    """
+    The Parquet schema of rows with the given columns, in that order.
+    """
+    return pa.schema([
+        ROW_SCHEMA.field(column) if column in ROW_SCHEMA.names else pa.field(column, pa.string())
+        for column in columns
+    ])
+
+
+class RowWriter(abc.ABC):
+    """
+    Writes pull-request rows to a file a chunk at a time as they are produced, so that only
+    one chunk of rows is held in memory however many pull requests are fetched.
+    """
+
+    def __init__(self, path: str, chunk_rows: int = CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.chunk: List[Dict] = []
+        self.rows = 0
+
+    def write(self, row: Dict):
+        self.chunk.append(row)
+        if len(self.chunk) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if self.chunk:
+            self.write_chunk(self.chunk)
+            self.rows += len(self.chunk)
+            self.chunk = []
+
+    @abc.abstractmethod
+    def write_chunk(self, rows: List[Dict]):
+        """
+        Write out a chunk of rows, after those already written (self.rows of them).
+        """
+
+    def close(self):
+        self.flush()
+
+    def abort(self):
+        """
+        Give up on the rows written so far (e.g. the fetch failed): the file is deleted rather than
+        left behind looking complete.
+        """
+        self.chunk = []
+        if self.rows and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvRowWriter(RowWriter):
+    """
+    CSV output, in the same format as a DataFrame of all the rows written at once. A run without
+    any rows still replaces the file, with only the header of the given columns.
+    """
+
+    def __init__(self, path: str, chunk_rows: int = CHUNK_ROWS, columns: Optional[List[str]] = None):
+        super().__init__(path, chunk_rows)
+        self.columns = columns or []
+
+    def write_chunk(self, rows: List[Dict]):
+        df = pd.DataFrame(rows)
+        for column in DATETIME_COLUMNS:
+            if column in df:
+                df[column] = pd.to_datetime(df[column])
+        for column in COUNTER_COLUMNS:
+            if column in df:
+                df[column] = df[column].astype("Int64")
+        first = self.rows == 0
+        df.to_csv(self.path, mode="w" if first else "a", header=first, index=False)
+
+    def close(self):
+        super().close()
+        if self.rows == 0:
+            pd.DataFrame(columns=self.columns).to_csv(self.path, index=False)  # Not left with an earlier run's rows
+
+
+class ParquetRowWriter(RowWriter):
+    """
+    Parquet output, one row group per chunk, typed by ROW_SCHEMA: categorical strings, int32
+    counters, bool flags, UTC timestamps and a list of labels. The columns are those of the
+    first chunk (or given upfront, in which case the file is written even if it has no rows),
+    so that a column that happens to be empty in one chunk keeps its type.
+    """
+
+    def __init__(self, path: str, chunk_rows: int = CHUNK_ROWS, columns: Optional[List[str]] = None):
+        super().__init__(path, chunk_rows)
+        self.schema = schema_for(columns) if columns is not None else None
+        self.writer = None
+
+    def write_chunk(self, rows: List[Dict]):
+        if self.schema is None:
+            self.schema = schema_for(rows[0])
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        super().close()
+        if self.writer is None and self.schema is not None:
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        if self.writer is not None:
+            self.writer.close()
+
+    def abort(self):
+        self.chunk = []
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(self.path)
+
+
+def open_row_writer(path: str, chunk_rows: int = CHUNK_ROWS, columns: Optional[List[str]] = None) -> RowWriter:
+    """
+    A writer of pull-request rows to path, in Parquet if it ends with '.parquet' and in CSV otherwise.
+    """
+    if path.endswith(".parquet"):
+        return ParquetRowWriter(path, chunk_rows, columns)
+    return CsvRowWriter(path, chunk_rows, columns)
@@ -0,0 +1,116 @@
+import ast
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# The columns a diff reads from each snapshot
+DIFF_COLUMNS = ["id", "number", "title", "state", "is_merged", "commits_behind_main", "labels", "comments",
+                "review_comments"]
+
+
+def label_sets(labels: pd.Series) -> pd.Series:
+    """
+    The labels of each row as a sorted tuple, whether they were loaded as lists (Parquet, snapshot
+    store) or as their string representation (CSV). Each distinct string is parsed once.
+    """
+    parsed = {}
+
+    def to_tuple(value):
+        if isinstance(value, str):
+            if value not in parsed:
+                parsed[value] = tuple(sorted(ast.literal_eval(value)))
+            return parsed[value]
+        if value is None or pd.api.types.is_scalar(value):
+            return ()  # Missing
+        return tuple(sorted(value))
+
+    return labels.map(to_tuple)
+
+
+def pair_snapshots(snapshots: List[Tuple[str, pd.DataFrame]]) -> pd.DataFrame:
+    """
+    Outer-join every snapshot with the next one on the pull request id (and repo, when the
+    snapshots have several), all pairs in one merge. Columns of the older snapshot end in
+    "_old" and of the newer one in "_new"; "from"/"to" name the snapshots of the pair and
+    "_merge" tells whether a PR is in both or only one of them.
+    """
+    keys = ["repo", "id"] if all("repo" in df for _, df in snapshots) else ["id"]
+    frames = []
+    for position, (name, df) in enumerate(snapshots):
+        columns = [*keys, *[column for column in DIFF_COLUMNS if column in df and column not in keys]]
+        frames.append(df[columns].assign(labels=label_sets(df["labels"]), snapshot=position))
+    stacked = pd.concat(frames, ignore_index=True)
+
+    # Snapshot k is the older side of pair k and the newer side of pair k-1
+    older = stacked[stacked["snapshot"] < len(snapshots) - 1].rename(columns={"snapshot": "pair"})
+    newer = stacked[stacked["snapshot"] > 0].assign(pair=lambda df: df["snapshot"] - 1).drop(columns="snapshot")
+    pairs = older.merge(newer, on=["pair", *keys], how="outer", suffixes=("_old", "_new"), indicator=True)
+    for column in ["number", "commits_behind_main", "comments", "review_comments"]:
+        for side in ["_old", "_new"]:
+            if column + side in pairs:
+                pairs[column + side] = pairs[column + side].astype("Int64")  # Missing on one side of the join
+    names = np.array([name for name, _ in snapshots])
+    pairs.insert(0, "from", names[pairs["pair"].to_numpy()])
+    pairs.insert(1, "to", names[pairs["pair"].to_numpy() + 1])
+    return pairs
+
+
+def diff_snapshots(snapshots: List[Tuple[str, pd.DataFrame]]) -> Dict[str, pd.DataFrame]:
+    """
+    What changed between each pair of consecutive (name, snapshot) pairs: the pull requests that
+    are new, that were closed or merged, that fell further behind main, whose labels changed and
+    that got new comments. Each result has "from"/"to" columns naming the pair.
+    """
+    pairs = pair_snapshots(snapshots)
+    both = pairs["_merge"] == "both"
+    ident = ["from", "to", *(["repo"] if "repo" in pairs else [])]
+
+    def title(df):
+        return df["title_new"].fillna(df["title_old"])
+
+    new = pairs[pairs["_merge"] == "right_only"]
+    new = new[ident].assign(number=new["number_new"], title=new["title_new"])
+
+    # A PR missing from the newer snapshot of open PRs was closed or merged; a full-history
+    # snapshot tells which
+    closed_now = both & (pairs["state_old"] == "open") & (pairs["state_new"] == "closed")
+    closed = pairs[(pairs["_merge"] == "left_only") | closed_now]
+    outcome = np.where(closed["_merge"] == "left_only", "closed or merged",
+                       np.where(closed["is_merged_new"].fillna(False).astype(bool), "merged", "closed"))
+    closed = closed[ident].assign(number=closed["number_old"], title=title(closed), outcome=outcome)
+
+    behind = pairs[both & (pairs["commits_behind_main_new"] > pairs["commits_behind_main_old"])]
+    behind = behind[ident].assign(
+        number=behind["number_new"], title=title(behind),
+        commits_behind_main=behind["commits_behind_main_new"],
+        grew_by=behind["commits_behind_main_new"] - behind["commits_behind_main_old"],
+    ).sort_values("grew_by", ascending=False, kind="stable")
+
+    changed = pairs[both & (pairs["labels_old"] != pairs["labels_new"])]
+    labels = changed[ident].assign(
+        number=changed["number_new"], title=title(changed),
+        added=[sorted(set(new_labels) - set(old_labels)) for old_labels, new_labels in zip(changed["labels_old"], changed["labels_new"])],
+        removed=[sorted(set(old_labels) - set(new_labels)) for old_labels, new_labels in zip(changed["labels_old"], changed["labels_new"])],
+    )
+
+    old_comments = pairs["comments_old"] + pairs["review_comments_old"]
+    new_comments = pairs["comments_new"] + pairs["review_comments_new"]
+    active = pairs[both & (new_comments > old_comments)]
+    comments = active[ident].assign(
+        number=active["number_new"], title=title(active),
+        new_comments=(new_comments - old_comments)[active.index],
+    ).sort_values("new_comments", ascending=False, kind="stable")
+
+    return {"new": new, "closed": closed, "behind": behind, "labels": labels, "comments": comments}
+
+
+def summarize_diff(diff: Dict[str, pd.DataFrame], names: List[str]) -> pd.DataFrame:
+    """
+    The number of pull requests of each kind of change, one row per pair of consecutive
+    snapshots (named in order by names), with zeros for a pair in which nothing changed.
+    """
+    counts = pd.DataFrame({kind: df.groupby(["from", "to"], sort=False).size() for kind, df in diff.items()})
+    pairs = pd.MultiIndex.from_arrays([names[:-1], names[1:]], names=["from", "to"])
+    return counts.reindex(pairs).fillna(0).astype(int).reset_index()
@@ -0,0 +1,288 @@
+import os
+from datetime import date, datetime, timezone
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from row_writer import ParquetRowWriter, schema_for
+
+
+# Directory levels of the store: <root>/repo=<owner%2Frepo>/date=<YYYY-MM-DD>/<HHMMSS>[.delta].parquet
+BASE_INTERVAL = 24  # Every this many captures of a repository is stored in full; the others as deltas
+DELTA_SUFFIX = ".delta.parquet"
+# Columns that change without the pull request changing; recomputed when a view is read
+DERIVED_COLUMNS = {"captured_at", "time_open_days"}
+
+
+class SnapshotWriter:
+    """
+    Appends the rows of one run to the store as a new capture, one Parquet file per repository.
+    Rows without a "repo" column belong to default_repo. Used like a RowWriter. default_repo and
+    repos are the repositories the run scans: one that gets no rows at all (e.g. all its pull
+    requests were closed) still gets a capture without them when it is closed.
+
+    A capture is stored in full (a base) every BASE_INTERVAL captures of a repository. In
+    between, only a delta against the previous capture is stored: the rows of the pull
+    requests added or changed since, and a row marked "removed" for each one that is gone.
+    """
+
+    def __init__(self, root: str, default_repo: Optional[str] = None, captured_at: Optional[datetime] = None,
+                 repos: Optional[List[str]] = None):
+        self.path = root
+        self.default_repo = default_repo
+        self.repos = [*([default_repo] if default_repo else []), *(repos or [])]
+        self.captured_at = (captured_at or datetime.now(timezone.utc)).replace(microsecond=0)
+        self.writers: Dict[str, ParquetRowWriter] = {}
+        self.previous: Dict[str, Optional[Dict[int, Dict]]] = {}  # Rows of the previous capture, by id
+        self.seen: Dict[str, Set[int]] = {}
+        self.last_columns: Dict[str, List[str]] = {}  # Of the previous capture, for a base that gets no rows
+
+    def open(self, repo_name: str):
+        captures = list_captures(self.path, [repo_name])
+        since_base = 0
+        for is_delta in reversed(captures["is_delta"].tolist()):
+            if not is_delta:
+                break
+            since_base += 1
+        if captures.empty or since_base + 1 >= BASE_INTERVAL:
+            self.previous[repo_name] = None
+            if not captures.empty:
+                self.last_columns[repo_name] = [name for name in pq.read_schema(captures["path"].iloc[-1]).names
+                                                if name != "removed"]
+            path = capture_path(self.path, repo_name, self.captured_at)
+            columns = None
+        else:
+            (_, view), = iter_views(captures, {captures["captured_at"].iloc[-1]})
+            self.previous[repo_name] = {row["id"]: row for row in view.to_pylist()}
+            self.seen[repo_name] = set()
+            path = capture_path(self.path, repo_name, self.captured_at, delta=True)
+            columns = [*view.column_names, "removed"]  # Written even if nothing has changed
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.writers[repo_name] = ParquetRowWriter(path, columns=columns)
+
+    def write(self, row: Dict):
+        row = dict(row)
+        repo_name = row.pop("repo", None) or self.default_repo  # Stored in the directory name instead
+        if repo_name not in self.writers:
+            self.open(repo_name)
+        row["captured_at"] = self.captured_at
+
+        previous = self.previous[repo_name]
+        if previous is not None:
+            self.seen[repo_name].add(row["id"])
+            old = previous.get(row["id"])
+            if old is not None and all(old.get(column) == value for column, value in row.items()
+                                       if column not in DERIVED_COLUMNS):
+                return  # Unchanged since the previous capture
+            row["removed"] = False
+        self.writers[repo_name].write(row)
+
+    def close(self):
+        for repo_name in self.repos:
+            if repo_name not in self.writers and not list_captures(self.path, [repo_name]).empty:
+                self.open(repo_name)  # No rows this time: all of its pull requests are gone
+        for repo_name, writer in self.writers.items():
+            previous = self.previous[repo_name]
+            if previous is not None:
+                for pr_id in previous.keys() - self.seen[repo_name]:
+                    writer.write({"id": pr_id, "captured_at": self.captured_at, "removed": True})
+            elif writer.rows == 0 and not writer.chunk and repo_name in self.last_columns:
+                writer.schema = schema_for(self.last_columns[repo_name])  # Written as an empty base
+            writer.close()
+
+    def abort(self):
+        """
+        Delete the files of the capture being written, so that an interrupted run does not leave
+        a partial capture behind to be taken for the latest one.
+        """
+        for writer in self.writers.values():
+            writer.abort()
+            for directory in (os.path.dirname(writer.path), os.path.dirname(os.path.dirname(writer.path))):
+                if os.path.isdir(directory) and not os.listdir(directory):
+                    os.rmdir(directory)  # Created for this capture only
+
+
+def capture_path(root: str, repo_name: str, captured_at: datetime, delta: bool = False) -> str:
+    """
+    Path of the file holding the capture of a repository taken at captured_at.
+    """
+    return os.path.join(root, f"repo={quote(repo_name, safe='')}", f"date={captured_at:%Y-%m-%d}",
+                        f"{captured_at:%H%M%S}{DELTA_SUFFIX if delta else '.parquet'}")
+
+
+def list_captures(root: str, repos: Optional[List[str]] = None, since: Optional[date] = None,
+                  until: Optional[date] = None) -> pd.DataFrame:
+    """
+    The captures in the store (repo, captured_at, path, is_delta), oldest first, found from the
+    directory names alone without opening any file.
+    """
+    captures = []
+    for repo_dir in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+        repo_name = unquote(repo_dir.split("=", 1)[1])
+        if repos and repo_name not in repos:
+            continue
+        for date_dir in sorted(os.listdir(os.path.join(root, repo_dir))):
+            day = date.fromisoformat(date_dir.split("=", 1)[1])
+            if (since and day < since) or (until and day > until):
+                continue
+            for name in sorted(os.listdir(os.path.join(root, repo_dir, date_dir))):
+                if name.endswith(".parquet"):
+                    captured_at = datetime.strptime(f"{day} {name[:6]}", "%Y-%m-%d %H%M%S").replace(tzinfo=timezone.utc)
+                    captures.append((repo_name, captured_at, os.path.join(root, repo_dir, date_dir, name),
+                                     name.endswith(DELTA_SUFFIX)))
+    captures = pd.DataFrame(captures, columns=["repo", "captured_at", "path", "is_delta"])
+    return captures.sort_values("captured_at", kind="stable", ignore_index=True)
+
+
+def read_capture(path: str, columns: Optional[List[str]] = None) -> pa.Table:
+    """
+    Read the given columns (those the file has) of one capture file.
+    """
+    if columns is not None:
+        names = pq.read_schema(path).names
+        columns = [column for column in columns if column in names]
+    return pq.read_table(path, columns=columns)
+
+
+def apply_delta(view: pa.Table, delta: pa.Table) -> pa.Table:
+    """
+    The view after a delta: the last row of each id, without the removed ones.
+    """
+    table = pa.concat_tables([view, delta], promote_options="default")
+    ids = table.column("id").to_numpy()
+    _, last_from_end = np.unique(ids[::-1], return_index=True)
+    table = table.take(np.sort(len(ids) - 1 - last_from_end))
+    if "removed" in table.column_names:
+        table = table.filter(pc.invert(pc.fill_null(table.column("removed"), False))).drop_columns(["removed"])
+    return table
+
+
+def iter_views(captures: pd.DataFrame, targets: Set[datetime],
+               columns: Optional[List[str]] = None) -> Iterator[Tuple[datetime, pa.Table]]:
+    """
+    Reconstruct the captures of one repository (rows of list_captures) taken at the target times,
+    oldest first. Each view starts from the last base before it and applies the deltas in order.
+    """
+    if columns is not None:
+        columns = list(dict.fromkeys(["id", "removed", *columns]))
+    first = min(targets)
+    start = 0
+    for position, (captured_at, is_delta) in enumerate(zip(captures["captured_at"], captures["is_delta"])):
+        if captured_at > first:
+            break
+        if not is_delta:
+            start = position
+
+    view = None
+    for _, capture in captures.iloc[start:].iterrows():
+        table = read_capture(capture["path"], columns)
+        view = apply_delta(view, table) if capture["is_delta"] else table  # A base starts afresh
+        captured_at = capture["captured_at"]
+        if captured_at in targets:
+            yield captured_at, view
+            if captured_at == max(targets):
+                return
+
+
+def view_frame(view: pa.Table, repo_name: str, captured_at: datetime) -> pd.DataFrame:
+    """
+    A reconstructed view as a DataFrame, with the time open of the pull requests carried over
+    from earlier captures brought up to the capture time.
+    """
+    df = view.to_pandas()
+    if "time_open_days" in df and "created_at" in df:
+        carried = (df["captured_at"] < captured_at) & df["closed_at"].isna()
+        days = (captured_at - df.loc[carried, "created_at"]).dt.days
+        df.loc[carried, "time_open_days"] = days.astype(df["time_open_days"].dtype)
+    df.insert(0, "repo", repo_name)
+    df["captured_at"] = captured_at
+    return df
+
+
+def load_snapshots(root: str, repos: Optional[List[str]] = None, since: Optional[date] = None,
+                   until: Optional[date] = None, columns: Optional[List[str]] = None,
+                   latest: bool = False) -> pd.DataFrame:
+    """
+    Load the captures of the store taken between since and until (inclusive dates), as one
+    DataFrame with "repo" and "captured_at" columns. The repository and date filters are applied
+    to the directory names, so files outside the range are never opened (apart from the base
+    and deltas a capture is built from), and only the requested columns are read from the
+    files that are. With latest, only the most recent capture of each repository in the range is loaded.
+    """
+    read_columns = view_columns(columns)
+    frames = []
+    for repo_name, captures in list_captures(root, repos, until=until).groupby("repo", sort=False):
+        wanted = captures[captures["captured_at"].dt.date >= since] if since else captures
+        if latest:
+            wanted = wanted.tail(1)
+        if wanted.empty:
+            continue
+        for captured_at, view in iter_views(captures, set(wanted["captured_at"]), read_columns):
+            frames.append(view_frame(view, repo_name, captured_at))
+
+    if not frames:
+        return pd.DataFrame(columns=["repo", "captured_at", *(columns or [])])
+    return select_view_columns(pd.concat(frames, ignore_index=True), columns)
+
+
+def view_columns(columns: Optional[List[str]]) -> Optional[List[str]]:
+    """
+    The columns to read from the capture files for a view with the given columns (None for all).
+    """
+    if columns is None:
+        return None
+    read_columns = [*columns, "captured_at"]
+    if "time_open_days" in columns:
+        read_columns += ["created_at", "closed_at"]  # To bring the time open up to the capture (see view_frame)
+    return read_columns
+
+
+def select_view_columns(df: pd.DataFrame, columns: Optional[List[str]]) -> pd.DataFrame:
+    if columns is None:
+        return df
+    return df[["repo", "captured_at", *[column for column in columns if column not in ("repo", "captured_at")]]]
+
+
+def load_view(root: str, repo_name: str, at: Optional[datetime] = None,
+              columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    The pull requests of a repository as of its last capture at or before the time at (by default, the latest).
+    """
+    captures = list_captures(root, [repo_name])
+    if at is not None:
+        captures = captures[captures["captured_at"] <= at]
+    if captures.empty:
+        return pd.DataFrame(columns=["repo", "captured_at", *(columns or [])])
+    captured_at = captures["captured_at"].iloc[-1]
+    (_, view), = iter_views(captures, {captured_at}, view_columns(columns))
+    return select_view_columns(view_frame(view, repo_name, captured_at), columns)
+
+
+def compact(root: str, repos: Optional[List[str]] = None, before: Optional[date] = None):
+    """
+    Rewrite the latest capture of each repository as a full base, so that reading it needs no
+    deltas. With before, the captures taken before that date are also folded into one base (at
+    the last of them) and the others deleted; the later deltas still apply on top of it.
+    """
+    for repo_name, captures in list_captures(root, repos).groupby("repo", sort=False):
+        rewrite = {captures["captured_at"].iloc[-1]}
+        older = captures[captures["captured_at"].dt.date < before] if before else captures.iloc[:0]
+        if not older.empty:
+            rewrite.add(older["captured_at"].iloc[-1])
+
+        paths = dict(zip(captures["captured_at"], captures["path"]))
+        views = [(captured_at, view) for captured_at, view in iter_views(captures, rewrite)
+                 if paths[captured_at].endswith(DELTA_SUFFIX)]
+        for captured_at, view in views:
+            pq.write_table(view, capture_path(root, repo_name, captured_at))
+            os.remove(paths[captured_at])
+        for path in older["path"].iloc[:-1]:
+            os.remove(path)
+            if not os.listdir(os.path.dirname(path)):
+                os.rmdir(os.path.dirname(path))  # No capture left on that date
+        print(f"Compacted {repo_name}: {len(views)} captures rewritten in full, {max(len(older) - 1, 0)} removed")
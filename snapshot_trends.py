@@ -0,0 +1,76 @@
+from typing import List, Optional
+
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+
+TREND_METRICS = ["time_open_days", "commits_behind_main", "lines_changed"]
+TREND_QUANTILES = [0.5, 0.9]
+# The columns trends read from each snapshot
+TREND_COLUMNS = ["id", "number", "title", *TREND_METRICS]
+
+
+def capture_aggregates(captures: pd.DataFrame, metrics: List[str] = TREND_METRICS,
+                       capture_times: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    One row per capture (and repository, if there is a "repo" column) of a long DataFrame of
+    snapshots with a "captured_at" column: the number of open pull requests and the mean and
+    quantiles (p50, p90) of each metric. With capture_times (the captures of a snapshot store,
+    see list_captures), a capture without any rows also gets a row, with no open pull requests
+    and missing metrics.
+    """
+    keys = [*(["repo"] if "repo" in captures else []), "captured_at"]
+    grouped = captures.groupby(keys, sort=True, observed=True)
+    aggregates = grouped[metrics].mean().add_suffix("_mean")
+    aggregates.insert(0, "open_prs", grouped.size())
+    quantiles = grouped[metrics].quantile(TREND_QUANTILES).unstack()
+    quantiles.columns = [f"{metric}_p{int(q * 100)}" for metric, q in quantiles.columns]
+    aggregates = aggregates.join(quantiles)
+    if capture_times is not None:
+        index = pd.MultiIndex.from_frame(capture_times[keys]) if len(keys) > 1 else pd.Index(capture_times["captured_at"])
+        aggregates = aggregates.reindex(index.unique()).sort_index()
+        aggregates["open_prs"] = aggregates["open_prs"].fillna(0).astype(int)
+    return aggregates.reset_index()
+
+
+def pr_trajectories(captures: pd.DataFrame, metric: str) -> pd.DataFrame:
+    """
+    The value of a metric for each pull request (columns, by repo and number) at each capture (rows).
+    """
+    columns = [*(["repo"] if "repo" in captures else []), "number"]
+    return captures.pivot_table(index="captured_at", columns=columns, values=metric, aggfunc="last", observed=True)
+
+
+def largest_changes(captures: pd.DataFrame, metric: str, k: int = 10) -> pd.DataFrame:
+    """
+    The k pull requests whose metric grew the most between their first and last capture.
+    """
+    trajectory = pr_trajectories(captures, metric)
+    first = trajectory.bfill().iloc[0]
+    last = trajectory.ffill().iloc[-1]
+    change = (last - first).rename(f"{metric}_change")
+    titles = captures.drop_duplicates(change.index.names, keep="last").set_index(change.index.names)["title"]
+    table = pd.concat([first.rename(f"{metric}_first"), last.rename(f"{metric}_last"), change], axis=1)
+    table = table[table[f"{metric}_change"] > 0]
+    return table.join(titles).nlargest(k, f"{metric}_change").reset_index()
+
+
+def create_trends_chart(aggregates: pd.DataFrame, metrics: List[str] = TREND_METRICS) -> go.Figure:
+    """
+    One time-series chart of the aggregates: the open pull requests and, for each metric,
+    its mean and p90, one line per repository.
+    """
+    fig = make_subplots(rows=len(metrics) + 1, cols=1, shared_xaxes=True,
+                        subplot_titles=["Open Pull Requests", *[metric.replace("_", " ").title() for metric in metrics]])
+    groups = aggregates.groupby("repo", sort=False) if "repo" in aggregates else [("", aggregates)]
+    for repo_name, group in groups:
+        prefix = f"{repo_name} " if repo_name else ""
+        fig.add_trace(go.Scatter(x=group["captured_at"], y=group["open_prs"], mode="lines+markers",
+                                 name=f"{prefix}open PRs"), row=1, col=1)
+        for row, metric in enumerate(metrics, start=2):
+            for statistic in ["mean", "p90"]:
+                fig.add_trace(go.Scatter(x=group["captured_at"], y=group[f"{metric}_{statistic}"], mode="lines+markers",
+                                         name=f"{prefix}{metric} {statistic}"), row=row, col=1)
+    fig.update_layout(title="Pull Request Trends", height=300 * (len(metrics) + 1))
+    return fig
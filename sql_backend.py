@@ -0,0 +1,227 @@
+import json
+import sqlite3
+from datetime import date, datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from row_writer import CHUNK_ROWS, RowWriter
+
+
+# Columns of the pull_requests table; a capture is identified by (repo, captured_at)
+COLUMNS = {
+    "repo": "TEXT NOT NULL",
+    "captured_at": "TEXT NOT NULL",  # ISO-8601 UTC, so that text order is time order
+    "id": "INTEGER NOT NULL",
+    "number": "INTEGER",
+    "title": "TEXT",
+    "user": "TEXT",
+    "state": "TEXT",
+    "created_at": "TEXT",
+    "updated_at": "TEXT",
+    "closed_at": "TEXT",
+    "merged_at": "TEXT",
+    "merge_commit_sha": "TEXT",
+    "additions": "INTEGER",
+    "deletions": "INTEGER",
+    "changed_files": "INTEGER",
+    "comments": "INTEGER",
+    "review_comments": "INTEGER",
+    "labels": "TEXT",  # JSON list
+    "num_labels": "INTEGER",
+    "commits_behind_main": "INTEGER",
+    "commits_ahead_main": "INTEGER",
+    "lines_changed": "INTEGER",
+    "time_open_days": "INTEGER",
+    "is_merged": "INTEGER",
+    "is_forked": "INTEGER",
+    "source_repo": "TEXT",
+    "is_draft": "INTEGER",
+    "is_locked": "INTEGER",
+    "is_needs_qa": "INTEGER",
+}
+RANKING_METRICS = ["num_labels", "commits_behind_main", "lines_changed", "time_open_days"]
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Open (creating it on first use) a SQLite database of pull-request captures.
+    """
+    conn = sqlite3.connect(path)
+    columns = ",\n    ".join(f'"{name}" {sql_type}' for name, sql_type in COLUMNS.items())
+    conn.executescript(f"""
+        CREATE TABLE IF NOT EXISTS pull_requests (
+            {columns},
+            PRIMARY KEY (repo, captured_at, id)
+        );
+        CREATE TABLE IF NOT EXISTS captures (
+            repo TEXT NOT NULL,
+            captured_at TEXT NOT NULL,
+            PRIMARY KEY (repo, captured_at)
+        );
+        CREATE INDEX IF NOT EXISTS idx_pull_requests_capture ON pull_requests (captured_at, repo);
+        CREATE INDEX IF NOT EXISTS idx_pull_requests_number ON pull_requests (repo, number);
+    """)
+    for metric in RANKING_METRICS:
+        # A ranking of a single capture reads its first rows in index order; over several, the
+        # index finds each capture's rows, which are then sorted
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_pull_requests_{metric} ON pull_requests (repo, captured_at, {metric})")
+    return conn
+
+
+def sql_value(value):
+    """
+    A row value as stored in SQLite: timestamps as ISO-8601 text, lists as JSON, missing values as NULL.
+    """
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return json.dumps(list(value))
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (datetime, pd.Timestamp)):
+        return pd.Timestamp(value).tz_convert("UTC").isoformat() if value.tzinfo else pd.Timestamp(value).isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def capture_time(captured_at: datetime) -> str:
+    return pd.Timestamp(captured_at).tz_convert("UTC").isoformat()
+
+
+def insert_rows(conn: sqlite3.Connection, rows: Iterable[Dict], default_repo: Optional[str], captured_at: datetime) -> int:
+    """
+    Insert the rows of one capture (replacing those already there), with the repo of rows that have none
+    set to default_repo, in the current transaction. Returns the number of rows inserted.
+    """
+    names = list(COLUMNS)
+    captured = capture_time(captured_at)
+    records, repos = [], set()
+    for row in rows:
+        repo_name = row.get("repo") or default_repo
+        repos.add(repo_name)
+        records.append([repo_name, captured, *[sql_value(row.get(name)) for name in names[2:]]])
+
+    placeholders = ", ".join("?" * len(names))
+    quoted = ", ".join(f'"{name}"' for name in names)
+    conn.executemany(f"INSERT OR REPLACE INTO pull_requests ({quoted}) VALUES ({placeholders})", records)
+    insert_captures(conn, repos, captured_at)
+    return len(records)
+
+
+def insert_captures(conn: sqlite3.Connection, repos: Iterable[str], captured_at: datetime):
+    """
+    Record a capture of each repository taken at captured_at, even one without any rows (all of
+    its pull requests were closed), so that it replaces the previous capture as the latest.
+    """
+    conn.executemany("INSERT OR IGNORE INTO captures (repo, captured_at) VALUES (?, ?)",
+                     [(repo_name, capture_time(captured_at)) for repo_name in repos])
+
+
+def import_frame(conn: sqlite3.Connection, df: pd.DataFrame, default_repo: Optional[str],
+                 captured_at: Optional[datetime] = None) -> int:
+    """
+    Insert a snapshot DataFrame. With a "captured_at" column (snapshot store), each row keeps
+    its own capture; otherwise all rows belong to the capture taken at captured_at.
+    """
+    with conn:
+        if "captured_at" not in df:
+            return insert_rows(conn, df.to_dict("records"), default_repo, captured_at)
+        return sum(insert_rows(conn, group.to_dict("records"), default_repo, capture)
+                   for capture, group in df.groupby("captured_at"))
+
+
+class SqliteRowWriter(RowWriter):
+    """
+    Inserts the rows of a run as a new capture of a SQLite database, a chunk at a time, in one
+    transaction committed when the writer is closed. default_repo and repos are the repositories
+    the run scans: each gets a capture, even without any rows.
+    """
+
+    def __init__(self, path: str, default_repo: Optional[str] = None, chunk_rows: int = CHUNK_ROWS,
+                 repos: Optional[List[str]] = None):
+        super().__init__(path, chunk_rows)
+        self.conn = connect(path)
+        self.default_repo = default_repo
+        self.repos = [*([default_repo] if default_repo else []), *(repos or [])]
+        self.captured_at = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def write_chunk(self, rows: List[Dict]):
+        insert_rows(self.conn, rows, self.default_repo, self.captured_at)
+
+    def close(self):
+        super().close()
+        insert_captures(self.conn, self.repos, self.captured_at)
+        self.conn.commit()
+        self.conn.close()
+
+    def abort(self):
+        """
+        Roll back the rows of the capture inserted so far.
+        """
+        self.chunk = []
+        self.conn.rollback()
+        self.conn.close()
+
+
+def latest_captures(repos: Optional[List[str]] = None, until: Optional[date] = None):
+    """
+    SQL selecting the latest capture of each repository (up to the end of the date until), and its parameters.
+    """
+    conditions, params = [], []
+    if repos:
+        conditions.append(f"repo IN ({', '.join('?' * len(repos))})")
+        params.extend(repos)
+    if until:
+        conditions.append("captured_at < ?")
+        params.append(f"{until.isoformat()}T24")  # Sorts after every time of that day
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"SELECT repo, MAX(captured_at) AS captured_at FROM captures {where} GROUP BY repo", params
+
+
+def query_averages(conn: sqlite3.Connection, metrics: List[str], repos: Optional[List[str]] = None,
+                   until: Optional[date] = None) -> Dict[str, float]:
+    """
+    The number of pull requests ("total") and the mean of each metric, over the latest captures.
+    """
+    latest, params = latest_captures(repos, until)
+    averages = ", ".join(f'AVG("{metric}")' for metric in metrics)
+    row = conn.execute(f"""
+        SELECT COUNT(*), {averages}
+        FROM pull_requests JOIN ({latest}) AS latest USING (repo, captured_at)
+    """, params).fetchone()
+    return {"total": row[0], **dict(zip(metrics, row[1:]))}
+
+
+def query_ranking(conn: sqlite3.Connection, columns: List[str], order_by: List[str], k: int,
+                  descending: bool = False, skip_missing: bool = True, repos: Optional[List[str]] = None,
+                  until: Optional[date] = None) -> pd.DataFrame:
+    """
+    The first k pull requests of the latest captures ordered by the order_by columns. With
+    skip_missing, rows missing the first column are left out like in DataFrame.nsmallest/nlargest;
+    otherwise missing values sort last like in DataFrame.sort_values.
+    """
+    latest, params = latest_captures(repos, until)
+    captures = conn.execute(latest, params).fetchall()
+    if len(captures) == 1:
+        # Selected by equality, so that SQLite can read the metric's index in order and stop after k rows
+        source, conditions, params = "pull_requests", ["repo = ?", "captured_at = ?"], list(captures[0])
+    else:
+        source, conditions = f"pull_requests JOIN ({latest}) AS latest USING (repo, captured_at)", []
+    if skip_missing:
+        conditions.append(f'"{order_by[0]}" IS NOT NULL')
+    direction = "DESC" if descending else "ASC"
+    # Missing values sort last; no "IS NULL" term where they were filtered out, as it would stop
+    # the index from being used for the order
+    order = ", ".join(f'"{column}" {direction}' if skip_missing and position == 0
+                      else f'"{column}" IS NULL, "{column}" {direction}'
+                      for position, column in enumerate(order_by))
+    selected = ", ".join(f'"{column}"' for column in columns)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return pd.read_sql_query(f"""
+        SELECT {selected}
+        FROM {source}
+        {where}
+        ORDER BY {order}, pull_requests.rowid  -- Ties in snapshot order, like pandas
+        LIMIT ?
+    """, conn, params=[*params, k])
@@ -0,0 +1,232 @@
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from snapshot_store import apply_delta, list_captures, read_capture, view_frame
+
+
+READ_CHUNK_ROWS = 100_000  # Rows read from a snapshot at a time
+SKETCH_SIZE = 200  # Items of the top level of a quantile sketch (a rank error well under 1%)
+STREAM_QUANTILES = [0.5, 0.9]
+
+
+class RunningStats:
+    """
+    The count, mean, variance, minimum and maximum of a stream of values, updated a chunk at a
+    time (Welford's algorithm, with the chunks combined as in Chan et al.) in constant memory.
+    Missing values are skipped.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = np.nan
+        self.m2 = 0.0  # Sum of the squared differences from the mean
+        self.min = np.nan
+        self.max = np.nan
+
+    def update(self, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        if len(values):
+            chunk = RunningStats()
+            chunk.count, chunk.mean = len(values), values.mean()
+            chunk.m2 = ((values - chunk.mean) ** 2).sum()
+            chunk.min, chunk.max = values.min(), values.max()
+            self.merge(chunk)
+
+    def merge(self, other: "RunningStats"):
+        if not other.count:
+            return
+        if not self.count:
+            self.count, self.mean, self.m2, self.min, self.max = other.count, other.mean, other.m2, other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+
+    @property
+    def variance(self) -> float:
+        """
+        The sample variance (like pandas' var), NaN for fewer than two values.
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else np.nan
+
+
+class QuantileSketch:
+    """
+    A KLL sketch of a stream of values: approximate quantiles in memory that only grows with the
+    logarithm of the number of values. Level h holds values that each stand for 2^h of the
+    stream; when a level is full it is sorted and every other value (from a random start) is
+    promoted to the level above. Missing values are skipped.
+    """
+
+    def __init__(self, size: int = SKETCH_SIZE, seed: Optional[int] = None):
+        self.size = size
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+
+    def capacity(self, level: int) -> int:
+        # The levels shrink geometrically below the top one
+        return max(2, int(np.ceil(self.size * (2 / 3) ** (len(self.levels) - level - 1))))
+
+    def update(self, values: np.ndarray):
+        self.levels[0] = np.concatenate([self.levels[0], values[~np.isnan(values)]])
+        self.compress()
+
+    def merge(self, other: "QuantileSketch"):
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.compress()
+
+    def compress(self):
+        while True:
+            full = [level for level, items in enumerate(self.levels) if len(items) > self.capacity(level)]
+            if not full:
+                return
+            level = full[0]
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))  # Which shrinks the capacities below: checked again
+            items = np.sort(self.levels[level])
+            end = len(items) - len(items) % 2  # An odd one out stays at this level
+            self.levels[level] = items[end:]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], items[self.rng.integers(2):end:2]])
+
+    def quantile(self, q: float) -> float:
+        items = np.concatenate(self.levels)
+        if not len(items):
+            return np.nan
+        weights = np.concatenate([np.full(len(values), 2 ** level) for level, values in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        cumulative = np.cumsum(weights[order])
+        return items[order][min(np.searchsorted(cumulative, q * cumulative[-1]), len(items) - 1)]
+
+
+class StreamingReport:
+    """
+    The number of rows and the RunningStats and QuantileSketch of each metric, per repository
+    (rows without a "repo" column count as repository ""), updated a chunk of rows at a time.
+    """
+
+    def __init__(self, metrics: List[str]):
+        self.metrics = metrics
+        self.rows: Dict[str, int] = {}
+        self.stats: Dict[str, Dict[str, RunningStats]] = {}
+        self.sketches: Dict[str, Dict[str, QuantileSketch]] = {}
+
+    def update(self, chunk: pd.DataFrame):
+        groups = chunk.groupby("repo", sort=False, observed=True) if "repo" in chunk else [("", chunk)]
+        for repo_name, group in groups:
+            if repo_name not in self.rows:
+                self.rows[repo_name] = 0
+                self.stats[repo_name] = {metric: RunningStats() for metric in self.metrics}
+                self.sketches[repo_name] = {metric: QuantileSketch() for metric in self.metrics}
+            self.rows[repo_name] += len(group)
+            matrix = group[self.metrics].to_numpy(dtype="float64", na_value=np.nan)
+            for position, metric in enumerate(self.metrics):
+                self.stats[repo_name][metric].update(matrix[:, position])
+                self.sketches[repo_name][metric].update(matrix[:, position])
+
+    def total(self) -> Dict[str, RunningStats]:
+        """
+        The statistics of each metric over all the repositories.
+        """
+        totals = {metric: RunningStats() for metric in self.metrics}
+        for stats in self.stats.values():
+            for metric, metric_stats in stats.items():
+                totals[metric].merge(metric_stats)
+        return totals
+
+    def table(self, by_repo: bool = False) -> pd.DataFrame:
+        """
+        One row per metric (and repository, with by_repo): count, mean, standard deviation,
+        minimum, approximate quantiles (STREAM_QUANTILES) and maximum.
+        """
+        if by_repo:
+            groups = [(repo_name, self.stats[repo_name], self.sketches[repo_name]) for repo_name in self.rows]
+        else:
+            sketches = {metric: QuantileSketch() for metric in self.metrics}
+            for repo_sketches in self.sketches.values():
+                for metric, sketch in repo_sketches.items():
+                    sketches[metric].merge(sketch)
+            groups = [(None, self.total(), sketches)]
+
+        records = []
+        for repo_name, stats, sketches in groups:
+            for metric in self.metrics:
+                record = {} if repo_name is None else {"repo": repo_name}
+                record.update(metric=metric, count=stats[metric].count, mean=stats[metric].mean,
+                              std=np.sqrt(stats[metric].variance), min=stats[metric].min)
+                record.update({f"p{int(q * 100)}": sketches[metric].quantile(q) for q in STREAM_QUANTILES})
+                record["max"] = stats[metric].max
+                records.append(record)
+        return pd.DataFrame(records)
+
+
+def iter_file_chunks(filename: str, columns: List[str], chunk_rows: int = READ_CHUNK_ROWS,
+                     parquet: bool = False) -> Iterator[pd.DataFrame]:
+    """
+    The given columns (those the file has) of a CSV or Parquet snapshot (given with parquet or
+    named *.parquet), chunk_rows rows at a time.
+    """
+    if parquet or filename.endswith(".parquet"):
+        parquet = pq.ParquetFile(filename)
+        columns = [column for column in columns if column in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    else:
+        header = pd.read_csv(filename, nrows=0).columns
+        with pd.read_csv(filename, usecols=[column for column in columns if column in header],
+                         dtype={"repo": "string"}, chunksize=chunk_rows) as reader:
+            yield from reader
+
+
+def iter_store_chunks(root: str, columns: List[str], repos: Optional[List[str]] = None, since=None, until=None,
+                      chunk_rows: int = READ_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    The given columns of the latest capture of each repository of a snapshot store (as
+    load_snapshots would load them), chunk_rows rows at a time. The base the capture is built
+    from is read in record batches, leaving out the pull requests its deltas change or remove;
+    the rows of the deltas follow. Only one batch and the deltas since the base are in memory.
+    """
+    read_columns = list(dict.fromkeys(["id", *columns, "captured_at"]))
+    if "time_open_days" in columns:
+        read_columns += ["created_at", "closed_at"]  # To bring the time open up to the capture (see view_frame)
+
+    for repo_name, captures in list_captures(root, repos, until=until).groupby("repo", sort=False):
+        wanted = captures[captures["captured_at"].dt.date >= since] if since else captures
+        if wanted.empty:
+            continue
+        captured_at = wanted["captured_at"].iloc[-1]
+        captures = captures[captures["captured_at"] <= captured_at]
+        start = np.flatnonzero(~captures["is_delta"].to_numpy())[-1]
+        base, deltas = captures["path"].iloc[start], list(captures["path"].iloc[start + 1:])
+
+        changes = None
+        if deltas:
+            tables = [read_capture(path, [*read_columns, "removed"]) for path in deltas]
+            combined = pa.concat_tables(tables, promote_options="default")
+            changed = pc.unique(combined.column("id"))
+            changes = apply_delta(combined.slice(0, 0), combined)
+
+        parquet = pq.ParquetFile(base)
+        names = [column for column in read_columns if column in parquet.schema_arrow.names]
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=names):
+            table = pa.Table.from_batches([batch])
+            if changes is not None:
+                table = table.filter(pc.invert(pc.is_in(table.column("id"), value_set=changed)))
+            yield select(view_frame(table, repo_name, captured_at), columns)
+        if changes is not None:
+            for start in range(0, changes.num_rows, chunk_rows):
+                yield select(view_frame(changes.slice(start, chunk_rows), repo_name, captured_at), columns)
+
+
+def select(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    return df[[column for column in columns if column in df]]